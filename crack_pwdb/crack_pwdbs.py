@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Description:
+
+This program tries to crack password databases like crack_pwdbs.sh.
+The candidates are streamed from the wordlist or directly from the
+generator of make_wordlist.py into a bounded pool of worker threads,
+each running the verifier command with a candidate on stdin. Only a
+limited number of candidates is queued ahead of the workers. A
+candidate is the password of a database, if the verifier exits with
+status 0, and it is rejected, if the verifier exits with status 1. Then
+the outstanding candidates are cancelled and the running verifiers are
+killed. Found passwords are appended to the results file as
+"<db>:<password>". Any other exit status is an error of the verifier
+and stops the program.
+
+The verifier command is split like a shell command and "{db}" is
+replaced by the database. The databases must exist. With -b the
+candidates rejected by the verifier are recorded in a Bloom filter
+file, which is created if needed. "{db}" in its name is replaced by the
+file name of the database, it is required for several databases.
+make_wordlist.py -s skips the recorded candidates in later runs. To
+test without a real database, a stand-in verifier can be used, e.g.
+
+    crack_pwdbs.py -c 'sh -c "read pw; [ \\"$pw\\" = p4ssword ]"' /dev/null
+
+Usage: crack_pwdbs.py [OPTIONS] [<db>...]
+
+Options:
+
+-b <file>:          Bloom filter file recording the rejected
+                    candidates, "{db}" is replaced by the file name of
+                    the database
+
+-c <command>:       Verifier command
+                    (Default: keepassxc-cli open -q {db})
+
+-e <p>:             False-positive rate of a new Bloom filter
+                    (Default: 0.001)
+
+-g:                 Generate the candidates from the passwords file of
+                    make_wordlist.py by increasing number of
+                    substitutions instead of reading the wordlist
+
+-h:                 Print usage information
+
+-j <n>:             Number of verifiers running at once (Default: 20)
+
+-n <n>:             Number of candidates of a new Bloom filter
+                    (Default: 10000000)
+
+-r <file>:          Results file (Default: ./results)
+
+-w <file>:          Wordlist file, plain or front coded, "-" for stdin
+                    (Default: ./wordlist)
+
+Databases: Default: ./pwdb.kdbx ./pwdb2.kdbx
+"""
+
+import concurrent.futures
+import getopt
+import os
+import shlex
+import subprocess
+import sys
+import threading
+import time
+
+import make_wordlist
+
+EXIT_SUCCESS = 0
+EXIT_FAILURE = 255
+
+DBS = ["./pwdb.kdbx", "./pwdb2.kdbx"]
+FILE_RESULTS = "./results"
+FILE_WORDLIST = "./wordlist"
+
+VERIFIER = "keepassxc-cli open -q {db}"
+
+# Exit status of the verifier for a wrong password
+STATUS_REJECTED = 1
+
+# Maximal number of verifiers running at once
+JOBS = 20
+
+# Number of candidates queued per verifier
+QUEUE_PER_JOB = 2
+
+# Interval of progress reports in seconds
+PROGRESS_INTERVAL = 10
+
+# Size of new Bloom filters of tried candidates
+BLOOM_CAPACITY = 10000000
+BLOOM_ERROR = 0.001
+
+
+class crack_pwdb:
+    """
+    Cracking of a password database by a pool of verifiers.
+    """
+
+    def __init__(self, db, command, jobs, tried=None):
+        self.db = db
+        self.command = [arg.replace("{db}", db) for arg in command]
+        self.jobs = jobs
+        self.tried = tried
+        self.found = threading.Event()
+        self.lock = threading.Lock()
+        self.procs = set()
+        self.n = 0
+
+    def verify(self, pw):
+        """
+        This method runs the verifier for the candidate pw and returns
+        True, if it is the password, False, if it was rejected, and None,
+        if the verification was cancelled. Raises RuntimeError, if the
+        verifier fails. It is run by the worker threads.
+        """
+
+        if self.found.is_set():
+            return None
+
+        proc = subprocess.Popen(
+            self.command, stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        with self.lock:
+            # The password could have been found while starting
+            if self.found.is_set():
+                proc.kill()
+            self.procs.add(proc)
+        try:
+            proc.communicate((pw + "\n").encode("utf-8"))
+        finally:
+            with self.lock:
+                self.procs.discard(proc)
+
+        if proc.returncode == 0:
+            return True
+        if proc.returncode == STATUS_REJECTED:
+            return False
+        if self.found.is_set():
+            return None
+        raise RuntimeError("verifier failed for {} with status {}".format(
+            self.db, proc.returncode
+        ))
+
+    def cancel(self):
+        """
+        This method stops the verification and kills the running
+        verifiers.
+        """
+
+        with self.lock:
+            self.found.set()
+            for proc in self.procs:
+                proc.kill()
+
+    def crack(self, candidates):
+        """
+        This method verifies the candidates and returns the password or
+        None, if no candidate is the password. New candidates are only
+        submitted, while less than QUEUE_PER_JOB candidates per verifier
+        are outstanding.
+        """
+
+        t_start = time.monotonic()
+        t_report = t_start
+        password = None
+        candidates = iter(candidates)
+        pending = {}
+
+        with concurrent.futures.ThreadPoolExecutor(self.jobs) as pool:
+            try:
+                while password is None:
+                    for pw in candidates:
+                        pending[pool.submit(self.verify, pw)] = pw
+                        if len(pending) >= self.jobs * QUEUE_PER_JOB:
+                            break
+                    if len(pending) == 0:
+                        break
+
+                    (done, not_done) = concurrent.futures.wait(
+                        pending, timeout=PROGRESS_INTERVAL,
+                        return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    for future in done:
+                        pw = pending.pop(future)
+                        result = future.result()
+                        if result is None:
+                            continue
+                        self.n += 1
+                        if result is True and password is None:
+                            password = pw
+                            self.cancel()
+                        elif result is False and self.tried is not None:
+                            self.tried.add(pw)
+
+                    t = time.monotonic()
+                    if t - t_report >= PROGRESS_INTERVAL:
+                        t_report = t
+                        self.report(t - t_start)
+            finally:
+                # Cancel outstanding candidates on a hit or an error
+                self.cancel()
+                for future in pending:
+                    future.cancel()
+
+        self.report(time.monotonic() - t_start)
+        return password
+
+    def report(self, t):
+        """
+        This method prints the progress after t seconds.
+        """
+
+        print("... {}: {} tries, {:.1f} tries/s".format(
+            self.db, self.n, self.n / t if t > 0 else 0.0
+        ), flush=True)
+
+
+def read_wordlist(fn):
+    """
+    This function yields the candidates of the wordlist fn or of stdin,
+    if fn is "-". Front-coded wordlists are decoded.
+    """
+
+    if fn != "-" and make_wordlist.is_front_coded(fn):
+        yield from make_wordlist.read_front_coded(fn)
+        return
+
+    fd = sys.stdin if fn == "-" else open(fn, "r", encoding="utf-8")
+    try:
+        for line in fd:
+            pw = line.rstrip("\n")
+            if len(pw) > 0:
+                yield pw
+    finally:
+        if fd is not sys.stdin:
+            fd.close()
+
+
+def generate_candidates():
+    """
+    This function yields the candidates of make_wordlist.py by
+    increasing number of substitutions.
+    """
+
+    if make_wordlist.is_multi(make_wordlist.SUBSTITUTES):
+        raise ValueError(
+            "Substitutions of several characters require a wordlist"
+        )
+
+    with open(make_wordlist.FILE_PASSWORDS, "r") as fd:
+        pws = fd.read().splitlines()
+    yield from make_wordlist.get_likely_candidates(
+        pws, make_wordlist.canonicalize(make_wordlist.SUBSTITUTES), {}
+    )
+
+
+def usage(fail=True):
+    """
+    This function terminates the program printing usage information.
+    """
+
+    if fail is True:
+        print(__doc__, file=sys.stderr)
+        sys.exit(EXIT_FAILURE)
+    else:
+        print(__doc__)
+        sys.exit(EXIT_SUCCESS)
+
+
+if __name__ == "__main__":
+    # Reading commandline arguments
+    command = VERIFIER
+    path_tried = None
+    error = BLOOM_ERROR
+    capacity = BLOOM_CAPACITY
+    generate = False
+    jobs = JOBS
+    fn_results = FILE_RESULTS
+    fn_wordlist = FILE_WORDLIST
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], "b:c:e:ghj:n:r:w:")
+        for opt in opts:
+            if opt[0] == "-b":
+                path_tried = opt[1]
+            elif opt[0] == "-c":
+                command = opt[1]
+            elif opt[0] == "-e":
+                error = float(opt[1])
+            elif opt[0] == "-g":
+                generate = True
+            elif opt[0] == "-h":
+                usage(fail=False)
+            elif opt[0] == "-j":
+                jobs = int(opt[1])
+            elif opt[0] == "-n":
+                capacity = int(opt[1])
+            elif opt[0] == "-r":
+                fn_results = opt[1]
+            elif opt[0] == "-w":
+                fn_wordlist = opt[1]
+            else:
+                raise Exception()
+        command = shlex.split(command)
+    except Exception:
+        usage()
+
+    if jobs < 1 or len(command) == 0 or capacity < 1 or not 0 < error < 1:
+        usage()
+    dbs = args if len(args) > 0 else DBS
+    if fn_wordlist == "-" and len(dbs) > 1:
+        usage()
+    if path_tried is not None and "{db}" not in path_tried and len(dbs) > 1:
+        usage()
+    for db in dbs:
+        if not os.path.exists(db):
+            print("Database \"{}\" does not exist".format(db), file=sys.stderr)
+            sys.exit(EXIT_FAILURE)
+
+    try:
+        for db in dbs:
+            print("Trying to find password for database \"{}\" ...".format(
+                db
+            ), flush=True)
+
+            if generate is True:
+                candidates = generate_candidates()
+            else:
+                candidates = read_wordlist(fn_wordlist)
+            tried = None
+            if path_tried is not None:
+                tried = make_wordlist.bloom_filter(
+                    path_tried.replace("{db}", os.path.basename(db)),
+                    capacity, error
+                )
+            try:
+                password = crack_pwdb(db, command, jobs, tried).crack(
+                    candidates
+                )
+            finally:
+                if tried is not None:
+                    tried.close()
+
+            if password is None:
+                print("Finished: No password found!")
+            else:
+                with open(fn_results, "a", encoding="utf-8") as fd:
+                    fd.write("{}:{}\n".format(db, password))
+                print("Finished: Password found! See resultfile \"{}\"".format(
+                    fn_results
+                ))
+    except KeyboardInterrupt:
+        sys.exit(EXIT_FAILURE)
+    except Exception as err:
+        print(err, file=sys.stderr)
+        sys.exit(EXIT_FAILURE)
@@ -1,13 +1,197 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from typing import Any, Dict, List
+"""
+Description:
+
+This program creates an extended wordlist from a list of expected
+passwords by substituting characters. The substitutions are
+canonicalized, so that every character has distinct options, and the
+base passwords are arranged in a trie, which is walked for all of them
+at once. Thus no candidate is generated twice. The wordlist is sorted
+by the reversed candidates. If the candidates do not fit into the
+memory budget, they are written to sorted runs in temporary files,
+which are merged afterwards.
+
+With -R the candidates are generated by the rules of a rules file
+instead of the substitutions. Each line contains a rule, empty lines
+and lines starting with "#" are ignored. The rules are applied in
+order, each rule yields every word it gets unchanged and its variants:
+
+    sub <c> <s> [<s>...]    Substitute the character c by one of the
+                            substitutions s, consecutive sub rules
+                            form one table
+    toggle                  Toggle the case of any letters
+    prefix <i>-<j>          Prepend a number from i up to j
+                            (inclusive), zero-padded to the length of i
+    append <i>-<j>          Append a number from i up to j (inclusive),
+                            zero-padded to the length of i
+    reverse                 Reverse the word
+    duplicate               Repeat the word
+
+Substitutions can also replace several characters at once, e.g. "ss"
+by "ß". Their occurrences in a base password are found by an
+Aho-Corasick automaton and the non-overlapping combinations of them and
+the substituted characters are enumerated. Combinations yielding the
+same candidate are only enumerated once. Substitutions of a character
+by several characters, e.g. "a" by "aa", are enumerated the same way,
+since different combinations of them can yield the same candidate. The
+options -j, -L, -n and -r require substitutions of single characters.
+
+With -j the candidates are partitioned by base password and, for long
+base passwords, by the options of their first characters into tasks.
+The tasks are distributed among worker processes, each writing its own
+sorted shard "<wordlist>.<i>". With -M the shards are merged into the
+wordlist afterwards.
+
+With -n nothing is generated. Instead the exact number of distinct
+candidates and the size of the wordlist in bytes are printed for each
+base password and in total.
+
+With -r the candidates are enumerated by index instead: the variants of
+each base password are numbered as mixed-radix numbers of the options
+of their characters, and the numbering continues over the base
+passwords in the order of the password file. The candidates of the
+index range are printed unsorted and not deduplicated, so ranges can be
+generated independently, e.g. on different machines. With -c the next
+index is recorded in a checkpoint file, from which an interrupted run
+resumes.
+
+With -L the wordlist is not sorted, but the candidates are written in
+the order of their likelihood instead: a candidate costs the sum of the
+weights of its substitutions, and the candidates are enumerated by
+increasing costs with a priority queue. The weight of a substitution is
+1 unless given in a weights file (-w), which contains lines
+"<c> <s> <weight>". A candidate common to several base passwords is
+written only once at its lowest costs.
+
+With -F the sorted wordlist is written front coded: the reversed
+candidates are stored in blocks, where the first one is stored
+completely and the following ones as the length of the prefix shared
+with their predecessor and the remaining suffix. An index of the block
+offsets at the end of the file allows to decode from any block. -D
+decodes a front-coded wordlist to stdout.
+
+With -s candidates recorded in a Bloom filter file are skipped. The
+Bloom filter is written by crack_pwdbs.py for the candidates it has
+already tried, so a run with extended substitutions only yields new
+candidates. Due to false positives, a few new candidates are skipped
+as well.
+
+Usage: make_wordlist.py [OPTIONS]
+
+Options:
+
+-b <n>:             First block to decode (only with -D, Default: 0)
+
+-c <file>:          Checkpoint file of the index range (only with -r)
+
+-D <file>:          Print the candidates of a front-coded wordlist
+
+-F:                 Write the wordlist front coded
+                    (not with -L and -r, with -j only with -M)
+
+-h:                 Print usage information
+
+-j <n>:             Number of worker processes writing shards
+                    (Default: 1, no shards)
+
+-m <MiB>:           Memory budget for sorting the candidates in MiB,
+                    shared among the worker processes (Default: 256)
+
+-L:                 Write the candidates by increasing costs
+                    (not with -j, -r and -R)
+
+-M:                 Merge the shards into the wordlist
+
+-n:                 Dry run, print the number of candidates and the
+                    size of the wordlist (only with substitutions by
+                    single characters)
+
+-R <file>:          Generate the candidates by the rules of a file
+                    (not with -j, -n and -r)
+
+-r <i>-[<j>]:       Print the candidates with index i up to j
+                    (exclusive, Default: all) to stdout
+
+-s <file>:          Skip the candidates in the Bloom filter file
+
+-T <dir>:           Directory for the temporary files of sorted runs
+                    (Default: system temporary directory)
+
+-w <file>:          Weights file of the substitutions (only with -L)
+"""
+
+import bisect
+import collections
+import getopt
+import hashlib
+import heapq
+import itertools
+import json
+import math
+import mmap
+import multiprocessing
+import os
+import signal
+import struct
+import sys
+import tempfile
+from array import array
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+EXIT_SUCCESS = 0
+EXIT_FAILURE = 255
 
 FILE_PASSWORDS = "./passwords"
 FILE_WORDLIST = "./wordlist"
 
+# Default memory budget for sorting in MiB
+MEMORY_BUDGET = 256
+
+# Estimated memory overhead of an entry of a set in bytes
+SET_ENTRY_SIZE = 64
+
+# Maximal number of runs merged at once
+MERGE_FAN_IN = 64
+
+# Number of tasks per worker process to balance the load
+TASKS_PER_JOB = 8
+
+# Number of candidates printed between checkpoints
+CHECKPOINT_INTERVAL = 100000
+
+# Front-coded wordlists: magic number, number of candidates per block,
+# header ("<magic><candidates per block>") and trailer ("<offset of the
+# index><number of candidates><magic>")
+FRONT_CODING_MAGIC = b"FCWL"
+FRONT_CODING_BLOCK = 64
+FRONT_CODING_HEADER = struct.Struct("<4sI")
+FRONT_CODING_TRAILER = struct.Struct("<QQ4s")
+
+# Bloom filter files: magic number and header ("<magic><number of
+# bits><number of hash functions><number of candidates>") followed by
+# the bits
+BLOOM_MAGIC = b"BLMF"
+BLOOM_HEADER = struct.Struct("<4s4xQII")
+
+# Weight of a substitution not given in the weights file
+SUBSTITUTION_WEIGHT = 1.0
+
+# Rules of rules files and their numbers of arguments, negative numbers
+# are minimal numbers of arguments
+RULES = {
+    "sub": -2,
+    "toggle": 0,
+    "prefix": 1,
+    "append": 1,
+    "reverse": 0,
+    "duplicate": 0
+}
+
 '''
-Add expected characters and there substitutions
+Add expected characters and there substitutions, characters can be
+substituted together, e.g. "ss": ["ß"]
 '''
 SUBSTITUTES = {
     "p": ["P"],
@@ -20,53 +204,1304 @@ SUBSTITUTES = {
 }
 
 
-def make_tree(pw: int, substitutes: Dict[str, List[str]]):
-    result = {}
+def canonicalize(
+    substitutes: Dict[str, List[str]]
+) -> Dict[str, List[str]]:
+    """
+    Returns the substitutions without duplicates and without the
+    substituted character itself, keeping their order.
+    """
 
-    if len(pw) > 0:
-        c = pw[0]
-        result[c] = make_tree(pw[1:], substitutes)
-        if c in substitutes:
-            for v in substitutes[c]:
-                result[v] = make_tree(pw[1:], substitutes)
-        return result
-    else:
-        return None
+    return {
+        c: [s for s in dict.fromkeys(subs) if s != c]
+        for (c, subs) in substitutes.items()
+    }
+
+
+def is_multi(substitutes: Dict[str, List[str]]) -> bool:
+    """
+    Returns whether substitutions of several characters at once are
+    contained in the substitutions.
+    """
+
+    return any(len(c) != 1 for c in substitutes)
+
+
+def is_fixed_length(substitutes: Dict[str, List[str]]) -> bool:
+    """
+    Returns whether every substitution replaces a character by a single
+    character, so variants have the length of their password.
+    """
+
+    return all(
+        len(c) == 1 and all(len(sub) == 1 for sub in subs)
+        for (c, subs) in substitutes.items()
+    )
+
+
+def make_automaton(
+    patterns: Iterable[str]
+) -> Tuple[List[Dict[str, int]], List[int], List[List[str]]]:
+    """
+    Returns the Aho-Corasick automaton of the patterns as goto function,
+    failure function and output function. The states are numbered, state
+    0 is the root. The output of a state are the patterns ending in it,
+    longest first.
+    """
+
+    goto = [{}]
+    out = [[]]
+    for pattern in patterns:
+        state = 0
+        for c in pattern:
+            if c not in goto[state]:
+                goto[state][c] = len(goto)
+                goto.append({})
+                out.append([])
+            state = goto[state][c]
+        out[state].append(pattern)
+
+    # The failure function is computed breadth first, so the failure
+    # state of a state is complete before its children
+    fail = [0] * len(goto)
+    queue = collections.deque(goto[0].values())
+    while len(queue) > 0:
+        state = queue.popleft()
+        for (c, child) in goto[state].items():
+            f = fail[state]
+            while f > 0 and c not in goto[f]:
+                f = fail[f]
+            fail[child] = goto[f].get(c, 0)
+            out[child] = out[child] + out[fail[child]]
+            queue.append(child)
+
+    return (goto, fail, out)
+
+
+def find_patterns(
+    automaton: Tuple[List[Dict[str, int]], List[int], List[List[str]]],
+    text: str
+) -> List[List[str]]:
+    """
+    Returns the patterns of the automaton starting at each position of
+    the text in time linear in the length of the text and the number of
+    occurrences.
+    """
+
+    (goto, fail, out) = automaton
+    found = [[] for c in text]
+    state = 0
+    for (i, c) in enumerate(text):
+        while state > 0 and c not in goto[state]:
+            state = fail[state]
+        state = goto[state].get(c, 0)
+        for pattern in out[state]:
+            found[i - len(pattern) + 1].append(pattern)
+    return found
+
+
+def get_choices(
+    pw: str, substitutes: Dict[str, List[str]],
+    automaton: Tuple[List[Dict[str, int]], List[int], List[List[str]]]
+) -> List[List[Tuple[int, str]]]:
+    """
+    Returns the choices at each position of a password as the number of
+    characters replaced and the replacement. The first choices are the
+    options of the character, followed by the substitutions of patterns
+    starting at the position.
+    """
+
+    found = find_patterns(automaton, pw)
+    return [
+        [(1, o) for o in [c] + substitutes.get(c, [])] + [
+            (len(pattern), sub)
+            for pattern in found[i]
+            for sub in substitutes[pattern]
+        ]
+        for (i, c) in enumerate(pw)
+    ]
 
 
-def get_tree_paths(tree: Dict[str, Any], paths: List[str]):
-    for k in tree:
-        v = tree[k]
-        sub_tree_paths = []
+def get_multi_variants(
+    pws: List[str], substitutes: Dict[str, List[str]],
+    automaton: Tuple[List[Dict[str, int]], List[int], List[List[str]]]
+) -> Iterator[str]:
+    """
+    Yields the distinct variants of the passwords with substitutions of
+    several characters. The automaton must contain the substituted
+    patterns of several characters. The choices of the passwords are
+    walked like get_candidates() walks the trie: a state is a password,
+    the position behind the replaced characters and the rest of the
+    replacement not yielded yet. The walk continues character by
+    character with the set of all states yielding this character, so a
+    variant is reached only once, no matter how many combinations of
+    choices yield it. The substitutions must be canonicalized.
+    """
 
-        if v is None:
-            paths.append(k)
+    choices = [get_choices(pw, substitutes, automaton) for pw in pws]
+    ends = {(p, len(pw), "") for (p, pw) in enumerate(pws)}
+
+    def close(states):
+        """
+        Returns the states extended by the choices of the states, which
+        have yielded their replacement completely.
+        """
+
+        closed = set(states)
+        stack = list(closed)
+        while len(stack) > 0:
+            (p, i, rest) = stack.pop()
+            if rest == "" and i < len(pws[p]):
+                for (n, sub) in choices[p][i]:
+                    state = (p, i + n, sub)
+                    if state not in closed:
+                        closed.add(state)
+                        stack.append(state)
+        return closed
+
+    stack = [("", close((p, 0, "") for p in range(len(pws))))]
+    while len(stack) > 0:
+        (variant, states) = stack.pop()
+        if not ends.isdisjoint(states):
+            yield variant
+
+        children = {}
+        for (p, i, rest) in states:
+            if rest != "":
+                children.setdefault(rest[0], []).append((p, i, rest[1:]))
+        for (c, states_next) in children.items():
+            stack.append((variant + c, close(states_next)))
+
+
+def get_substitution_stage(
+    substitutes: Dict[str, List[str]]
+) -> Callable[[str], Iterator[str]]:
+    """
+    Returns a function yielding the distinct variants of a word for the
+    canonical substitutions.
+    """
+
+    if is_fixed_length(substitutes) is True:
+        return lambda w: get_variants(w, substitutes)
+
+    automaton = make_automaton(c for c in substitutes if len(c) > 1)
+    return lambda w: get_multi_variants([w], substitutes, automaton)
+
+
+def make_trie(pws: Iterable[str]) -> Dict:
+    """
+    Returns a trie of the passwords as nested dictionaries mapping
+    characters to subtries. The key None marks the end of a password.
+    """
+
+    trie = {}
+    for pw in pws:
+        node = trie
+        for c in pw:
+            node = node.setdefault(c, {})
+        node[None] = True
+    return trie
+
+
+def get_candidates(
+    trie: Dict, substitutes: Dict[str, List[str]]
+) -> Iterator[str]:
+    """
+    Yields the distinct variants of the passwords of the trie. The trie
+    is walked for a set of nodes at once: for each option of the
+    characters of the nodes, the walk continues with all nodes reached
+    by a character having this option. So common variants of several
+    passwords are yielded only once. The substitutions must be
+    canonicalized and of fixed length.
+    """
+
+    stack = [("", [trie])]
+    while len(stack) > 0:
+        (prefix, nodes) = stack.pop()
+        if any(None in node for node in nodes):
+            yield prefix
+
+        children = {}
+        for node in nodes:
+            for (c, child) in node.items():
+                if c is not None:
+                    for o in [c] + substitutes.get(c, []):
+                        children.setdefault(o, []).append(child)
+        for (o, nodes_next) in children.items():
+            stack.append((prefix + o, nodes_next))
+
+
+def get_options(
+    pw: str, substitutes: Dict[str, List[str]]
+) -> List[List[str]]:
+    """
+    Returns the options of each character of a password, which are the
+    character itself and its substitutions.
+    """
+
+    return [[c] + substitutes.get(c, []) for c in pw]
+
+
+def get_variants(
+    pw: str, substitutes: Dict[str, List[str]]
+) -> Iterator[str]:
+    """
+    Yields the variants of a password, where each character is replaced
+    by itself or one of its substitutions. The variants are generated
+    lazily as cartesian product of the options of each character, so
+    only the options and the current variant are kept in memory.
+    """
+
+    options = get_options(pw, substitutes)
+    for variant in itertools.product(*options):
+        yield "".join(variant)
+
+
+def load_weights(fn: str) -> Dict[Tuple[str, str], float]:
+    """
+    Returns the weights of the substitutions in the weights file fn,
+    mapping a character and its substitution to the weight. Raises
+    ValueError on an invalid line.
+    """
+
+    weights = {}
+    with open(fn, "r", encoding="utf-8") as fd:
+        for (i, line) in enumerate(fd, 1):
+            fields = line.split()
+            if len(fields) == 0 or fields[0].startswith("#"):
+                continue
+            try:
+                (c, sub, weight) = fields
+                weights[(c, sub)] = float(weight)
+            except ValueError:
+                raise ValueError("{}:{}: invalid weight: {}".format(
+                    fn, i, line.strip()
+                ))
+    return weights
+
+
+def get_costs(
+    pw: str, substitutes: Dict[str, List[str]],
+    weights: Dict[Tuple[str, str], float]
+) -> List[Dict[str, float]]:
+    """
+    Returns for each character of a password the costs of its options,
+    which are 0 for the character itself and the weights of the
+    substitutions.
+    """
+
+    return [
+        dict(
+            [(c, 0.0)] + [
+                (sub, weights.get((c, sub), SUBSTITUTION_WEIGHT))
+                for sub in substitutes.get(c, [])
+            ]
+        )
+        for c in pw
+    ]
+
+
+def get_likely_candidates(
+    pws: List[str], substitutes: Dict[str, List[str]],
+    weights: Dict[Tuple[str, str], float]
+) -> Iterator[str]:
+    """
+    Yields the distinct variants of the passwords by increasing costs.
+    The options of each character are sorted by costs, so a variant is
+    given by the digits of its options and increasing a digit never
+    decreases the costs. The priority queue starts with the password
+    itself. A popped variant pushes its successors, which increase one
+    digit at or behind its last nonzero digit, so every variant has
+    exactly one predecessor. The queue is ordered by costs, password and
+    digits, and a variant is only yielded for its first derivation in
+    this order, which is looked up in the other passwords. The
+    substitutions must be canonicalized.
+    """
+
+    costs = [get_costs(pw, substitutes, weights) for pw in pws]
+    options = [
+        [sorted(cost, key=cost.get) for cost in costs_pw]
+        for costs_pw in costs
+    ]
+
+    # Substitutions by several characters change the length, so a
+    # variant can have several derivations from any password
+    fixed = is_fixed_length(substitutes)
+    by_length = {}
+    for (p, pw) in enumerate(pws):
+        by_length.setdefault(len(pw), []).append(p)
+
+    def get_cost(p, digits):
+        """
+        Returns the costs of the variant of the p-th password given by
+        the digits.
+        """
+
+        return sum(
+            cost_c[o[d]]
+            for (cost_c, o, d) in zip(costs[p], options[p], digits)
+        )
+
+    def get_first(p, variant):
+        """
+        Returns the first derivation (costs, digits) of the variant from
+        the p-th password or None, if it is not a variant. The
+        derivations ending at each position of the variant are computed
+        character by character of the password.
+        """
+
+        if fixed is True:
+            if len(variant) != len(pws[p]):
+                return None
+            try:
+                digits = tuple(
+                    o.index(c) for (o, c) in zip(options[p], variant)
+                )
+            except ValueError:
+                return None
+            return (get_cost(p, digits), digits)
+
+        firsts = {0: (0.0, ())}
+        for (cost_c, o) in zip(costs[p], options[p]):
+            firsts_next = {}
+            for (j, (cost, digits)) in firsts.items():
+                for (d, sub) in enumerate(o):
+                    if variant.startswith(sub, j):
+                        first = (cost + cost_c[sub], digits + (d,))
+                        k = j + len(sub)
+                        if k not in firsts_next or first < firsts_next[k]:
+                            firsts_next[k] = first
+            firsts = firsts_next
+        return firsts.get(len(variant))
+
+    def is_first(p, variant, cost, digits):
+        """
+        Returns whether no password derives the variant before the
+        p-th password does with the digits.
+        """
+
+        qs = by_length.get(len(variant), []) if fixed else range(len(pws))
+        for q in qs:
+            if fixed is False or q != p:
+                first = get_first(q, variant)
+                if first is not None and (
+                    (first[0], q, first[1]) < (cost, p, digits)
+                ):
+                    return False
+        return True
+
+    heap = [(0.0, p, (0,) * len(pw)) for (p, pw) in enumerate(pws)]
+    heapq.heapify(heap)
+    while len(heap) > 0:
+        (cost, p, digits) = heapq.heappop(heap)
+        variant = "".join(o[d] for (o, d) in zip(options[p], digits))
+        if is_first(p, variant, cost, digits):
+            yield variant
+
+        last = max(
+            (k for (k, d) in enumerate(digits) if d > 0), default=0
+        )
+        for k in range(last, len(digits)):
+            if digits[k] + 1 < len(options[p][k]):
+                succ = digits[:k] + (digits[k] + 1,) + digits[k + 1:]
+                heapq.heappush(heap, (get_cost(p, succ), p, succ))
+
+
+def load_rules(fn: str) -> List[List[str]]:
+    """
+    Returns the rules of the rules file fn as lists of the name and the
+    arguments. Raises ValueError on an invalid rule.
+    """
+
+    rules = []
+    with open(fn, "r", encoding="utf-8") as fd:
+        for (i, line) in enumerate(fd, 1):
+            rule = line.split()
+            if len(rule) == 0 or rule[0].startswith("#"):
+                continue
+            n_args = RULES.get(rule[0])
+            if (
+                n_args is None
+                or (n_args >= 0 and len(rule) - 1 != n_args)
+                or (n_args < 0 and len(rule) - 1 < -n_args)
+            ):
+                raise ValueError("{}:{}: invalid rule: {}".format(
+                    fn, i, line.strip()
+                ))
+            rules.append(rule)
+    return rules
+
+
+def parse_range(arg: str) -> List[str]:
+    """
+    Returns the zero-padded numbers of a range "<i>-<j>".
+    """
+
+    (beg, end) = arg.split("-")
+    return [str(n).zfill(len(beg)) for n in range(int(beg), int(end) + 1)]
+
+
+def compile_rules(
+    rules: List[List[str]]
+) -> List[Callable[[str], Iterator[str]]]:
+    """
+    Compiles the rules to a plan of stages. A stage is a function
+    yielding a word and its variants. Consecutive sub rules are merged
+    into one canonical substitution table and ranges are expanded once.
+    """
+
+    stages = []
+    table = None
+    for rule in rules:
+        if rule[0] == "sub":
+            if table is None:
+                table = {}
+                stages.append(None)
+            table.setdefault(rule[1], []).extend(rule[2:])
             continue
+        elif table is not None:
+            stages[-1] = get_substitution_stage(canonicalize(table))
+            table = None
+
+        if rule[0] == "toggle":
+            stages.append(lambda w: get_variants(w, {
+                c: [c.swapcase()] for c in w if c.swapcase() != c
+            }))
+        elif rule[0] == "prefix":
+            stages.append(lambda w, ns=parse_range(rule[1]): itertools.chain(
+                [w], (n + w for n in ns)
+            ))
+        elif rule[0] == "append":
+            stages.append(lambda w, ns=parse_range(rule[1]): itertools.chain(
+                [w], (w + n for n in ns)
+            ))
+        elif rule[0] == "reverse":
+            stages.append(lambda w: iter([w, w[::-1]]))
+        elif rule[0] == "duplicate":
+            stages.append(lambda w: iter([w, w + w]))
+
+    if table is not None:
+        stages[-1] = get_substitution_stage(canonicalize(table))
+    return stages
+
+
+def apply_rules(
+    words: Iterable[str], stages: List[Callable[[str], Iterator[str]]]
+) -> Iterator[str]:
+    """
+    Yields the variants of the words by chaining the stages as
+    generators, so no intermediate lists are materialized.
+    """
+
+    for stage in stages:
+        words = itertools.chain.from_iterable(map(stage, words))
+    yield from words
+
+
+def count_variants(options: List[List[str]]) -> int:
+    """
+    Returns the number of variants of the options.
+    """
 
-        if isinstance(v, Dict):
-            get_tree_paths(v, sub_tree_paths)
+    return math.prod(len(o) for o in options)
 
-        for i in range(0, len(sub_tree_paths)):
-            paths.append(sub_tree_paths[i] + k)
+
+def get_offsets(
+    pws: List[str], substitutes: Dict[str, List[str]]
+) -> List[int]:
+    """
+    Returns the index of the first variant of each password followed by
+    the total number of variants.
+    """
+
+    return list(itertools.accumulate(
+        (count_variants(get_options(pw, substitutes)) for pw in pws),
+        initial=0
+    ))
+
+
+def get_digits(options: List[List[str]], index: int) -> List[int]:
+    """
+    Returns the digits of an index, which are the indices of the options
+    of each character of the variant with this index. The last
+    character is the least significant digit, so the indices follow
+    the order of get_variants().
+    """
+
+    digits = [0] * len(options)
+    for k in range(len(options) - 1, -1, -1):
+        (index, digits[k]) = divmod(index, len(options[k]))
+    return digits
+
+
+def get_range(
+    pws: List[str], substitutes: Dict[str, List[str]],
+    start: int, stop: int
+) -> Iterator[str]:
+    """
+    Yields the variants of the passwords with index start up to stop
+    (exclusive). The digits of the first variant are computed directly
+    from its index, the following ones by incrementing the digits.
+    """
+
+    offsets = get_offsets(pws, substitutes)
+    i = max(bisect.bisect_right(offsets, start) - 1, 0)
+    index = start
+    while i < len(pws) and index < stop:
+        options = get_options(pws[i], substitutes)
+        first = index - offsets[i]
+        n = min(stop, offsets[i + 1]) - index
+        if n > 0:
+            digits = get_digits(options, first)
+            variant = [o[d] for (o, d) in zip(options, digits)]
+            for j in range(n):
+                yield "".join(variant)
+                k = len(options) - 1
+                while k >= 0:
+                    digits[k] += 1
+                    if digits[k] < len(options[k]):
+                        variant[k] = options[k][digits[k]]
+                        break
+                    digits[k] = 0
+                    variant[k] = options[k][0]
+                    k -= 1
+            index += n
+        i += 1
+
+
+def load_checkpoint(fn: str, start: int, stop: int) -> int:
+    """
+    Returns the next index recorded in the checkpoint file fn for the
+    range start up to stop or start, if there is no checkpoint.
+    """
+
+    try:
+        with open(fn, "r") as fd:
+            checkpoint = json.load(fd)
+    except FileNotFoundError:
+        return start
+
+    if checkpoint["start"] != start or checkpoint["stop"] != stop:
+        raise ValueError("checkpoint {} belongs to range {}-{}".format(
+            fn, checkpoint["start"], checkpoint["stop"]
+        ))
+    return checkpoint["index"]
+
+
+def save_checkpoint(fn: str, start: int, stop: int, index: int) -> None:
+    """
+    Records the next index of the range start up to stop in the
+    checkpoint file fn. The file is replaced atomically, so that an
+    interrupted run never leaves a corrupted checkpoint behind.
+    """
+
+    path_tmp = "{}.tmp".format(fn)
+    with open(path_tmp, "w") as fd:
+        json.dump({"start": start, "stop": stop, "index": index}, fd)
+    os.replace(path_tmp, fn)
+
+
+def count_candidates(
+    pws: List[str], substitutes: Dict[str, List[str]]
+) -> Tuple[int, int]:
+    """
+    Returns the exact number of distinct variants of the passwords and
+    the size in bytes of the wordlist containing them, without
+    generating the variants. The substitutions must replace single
+    characters by single characters. Variants of passwords of different length
+    are distinct. For passwords of the same length the variants are
+    counted position by position: the characters at a position are
+    grouped by the set of passwords they are an option of, and only
+    these passwords remain for the following positions. The counts are
+    memoized by position and set of passwords, so a single password
+    takes time linear in its length.
+    """
+
+    count = 0
+    size = 0
+    by_length = {}
+    for pw in set(pws):
+        by_length.setdefault(len(pw), []).append(
+            [set(o) for o in get_options(pw, substitutes)]
+        )
+
+    for (length, options) in by_length.items():
+        memo = {}
+
+        def count_suffixes(i, alive):
+            """
+            Returns the number and the size in bytes of the distinct
+            suffixes from position i of the passwords alive.
+            """
+
+            if i == length:
+                return (1, 0)
+            if (i, alive) in memo:
+                return memo[(i, alive)]
+
+            groups = {}
+            for c in set().union(*[options[p][i] for p in alive]):
+                group = frozenset(p for p in alive if c in options[p][i])
+                groups.setdefault(group, []).append(c)
+
+            n = 0
+            n_bytes = 0
+            for (group, chars) in groups.items():
+                (n_suffix, n_bytes_suffix) = count_suffixes(i + 1, group)
+                n += len(chars) * n_suffix
+                n_bytes += len(chars) * n_bytes_suffix + n_suffix * sum(
+                    len(c.encode("utf-8")) for c in chars
+                )
+            memo[(i, alive)] = (n, n_bytes)
+            return (n, n_bytes)
+
+        (n, n_bytes) = count_suffixes(0, frozenset(range(len(options))))
+        count += n
+        size += n_bytes + n
+
+    return (count, size)
+
+
+def get_tasks(
+    pws: List[str], substitutes: Dict[str, List[str]], n: int
+) -> List[Tuple[str, int, str, int]]:
+    """
+    Partitions the variants of the passwords into about n tasks. A task
+    (pw, k, prefix, size) covers the size variants of pw, whose first k
+    characters are replaced by prefix. Passwords with more variants than
+    a task should have are split by the options of their first
+    characters.
+    """
+
+    options = [get_options(pw, substitutes) for pw in pws]
+    size_max = max(
+        math.ceil(sum(count_variants(o) for o in options) / n), 1
+    )
+
+    tasks = []
+    for (pw, o) in zip(pws, options):
+        k = 0
+        while k < len(pw) and count_variants(o[k:]) > size_max:
+            k += 1
+        size = count_variants(o[k:])
+        for prefix in itertools.product(*o[:k]):
+            tasks.append((pw, k, "".join(prefix), size))
+    return tasks
+
+
+def assign_tasks(
+    tasks: List[Tuple[str, int, str, int]], n: int
+) -> List[List[Tuple[str, int, str, int]]]:
+    """
+    Assigns the tasks to n workers, always giving the largest remaining
+    task to the worker with the least variants.
+    """
+
+    workers = [(0, i, []) for i in range(n)]
+    for task in sorted(tasks, key=lambda t: t[3], reverse=True):
+        (size, i, assigned) = heapq.heappop(workers)
+        assigned.append(task)
+        heapq.heappush(workers, (size + task[3], i, assigned))
+    return [assigned for (size, i, assigned) in sorted(workers)]
+
+
+def write_run(keys: Iterable[str], path_dir: str, i: int) -> str:
+    """
+    Writes the sorted keys to the i-th run in the directory path_dir
+    and returns the path of the run.
+    """
+
+    path_run = os.path.join(path_dir, "run_{}".format(i))
+    with open(path_run, "w", encoding="utf-8") as fd:
+        for key in keys:
+            fd.write(key + "\n")
+    return path_run
+
+
+def read_run(path_run: str) -> Iterator[str]:
+    """
+    Yields the keys of a run.
+    """
+
+    with open(path_run, "r", encoding="utf-8", newline="\n") as fd:
+        for line in fd:
+            yield line[:-1]
+
+
+def merge_runs(runs: List[str], path_dir: str) -> Iterator[str]:
+    """
+    Yields the unique keys of the sorted runs in sorted order using a
+    k-way merge. At most MERGE_FAN_IN runs are opened at once, larger
+    numbers of runs are merged to intermediate runs before.
+    """
+
+    i = len(runs)
+    while len(runs) > MERGE_FAN_IN:
+        merged = []
+        for j in range(0, len(runs), MERGE_FAN_IN):
+            group = runs[j:j + MERGE_FAN_IN]
+            merged.append(write_run(
+                unique(heapq.merge(*[read_run(r) for r in group])),
+                path_dir, i
+            ))
+            i += 1
+            for r in group:
+                os.remove(r)
+        runs = merged
+
+    yield from unique(heapq.merge(*[read_run(r) for r in runs]))
+
+
+def unique(keys: Iterable[str]) -> Iterator[str]:
+    """
+    Yields the sorted keys without consecutive duplicates.
+    """
+
+    last = None
+    for key in keys:
+        if key != last:
+            yield key
+            last = key
+
+
+def sort_unique(
+    keys: Iterable[str], memory: int, path_tmp: Optional[str] = None
+) -> Iterator[str]:
+    """
+    Yields the unique keys in sorted order. The keys are collected in a
+    set until the estimated size exceeds memory bytes. Then the set is
+    written as sorted run to a temporary file. Finally the runs are
+    merged dropping duplicates.
+    """
+
+    with tempfile.TemporaryDirectory(dir=path_tmp) as path_dir:
+        runs = []
+        run = set()
+        size = 0
+        for key in keys:
+            if key not in run:
+                run.add(key)
+                size += sys.getsizeof(key) + SET_ENTRY_SIZE
+                if size >= memory:
+                    runs.append(write_run(sorted(run), path_dir, len(runs)))
+                    run = set()
+                    size = 0
+
+        if len(runs) == 0:
+            yield from sorted(run)
+            return
+
+        if len(run) > 0:
+            runs.append(write_run(sorted(run), path_dir, len(runs)))
+        del run
+
+        yield from merge_runs(runs, path_dir)
+
+
+def write_keys(
+    keys: Iterable[str], fn: str, front_coded: bool = False
+) -> None:
+    """
+    Writes the reversed keys to the wordlist fn, front coded if
+    front_coded is True.
+    """
+
+    if front_coded is True:
+        write_front_coded(keys, fn)
+        return
+
+    with open(fn, "w", encoding="utf-8") as fd:
+        for key in keys:
+            fd.write(key[::-1] + "\n")
+
+
+def write_wordlist(
+    keys: Iterable[str], fn: str, memory: int,
+    path_tmp: Optional[str] = None, front_coded: bool = False
+) -> None:
+    """
+    Writes the unique reversed keys to the wordlist fn sorted by the
+    keys.
+    """
+
+    write_keys(sort_unique(keys, memory, path_tmp), fn, front_coded)
+
+
+def write_shard(
+    tasks: List[Tuple[str, int, str, int]],
+    substitutes: Dict[str, List[str]],
+    fn: str, memory: int, path_tmp: Optional[str] = None,
+    path_tried: Optional[str] = None
+) -> str:
+    """
+    Writes the variants of the tasks to the shard fn and returns fn.
+    This function is run by the worker processes.
+    """
+
+    variants = (
+        prefix + v
+        for (pw, k, prefix, size) in tasks
+        for v in get_variants(pw[k:], substitutes)
+    )
+    keys = (v[::-1] for v in skip_tried(variants, path_tried))
+    write_wordlist(keys, fn, memory, path_tmp)
+    return fn
+
+
+def read_shard(fn: str) -> Iterator[str]:
+    """
+    Yields the keys of a shard, which are the reversed entries.
+    """
+
+    with open(fn, "r", encoding="utf-8", newline="\n") as fd:
+        for line in fd:
+            yield line[-2::-1]
+
+
+def encode_varint(n: int) -> bytes:
+    """
+    Returns the LEB128 encoding of the non-negative integer n.
+    """
+
+    b = bytearray()
+    while n >= 0x80:
+        b.append(n & 0x7f | 0x80)
+        n >>= 7
+    b.append(n)
+    return bytes(b)
+
+
+def write_front_coded(
+    keys: Iterable[str], fn: str, block: int = FRONT_CODING_BLOCK
+) -> None:
+    """
+    Writes the keys front coded to the file fn. The keys are encoded as
+    UTF-8 and stored in blocks of block keys. Each key is stored as
+    varints of the length of the prefix shared with the previous key of
+    the block and the length of the suffix followed by the suffix.
+    """
+
+    offsets = array("Q")
+    n = 0
+    prev = b""
+    with open(fn, "wb") as fd:
+        fd.write(FRONT_CODING_HEADER.pack(FRONT_CODING_MAGIC, block))
+        for key in keys:
+            key = key.encode("utf-8")
+            if n % block == 0:
+                offsets.append(fd.tell())
+                lcp = 0
+            else:
+                lcp = len(os.path.commonprefix([prev, key]))
+            fd.write(
+                encode_varint(lcp) + encode_varint(len(key) - lcp)
+                + key[lcp:]
+            )
+            prev = key
+            n += 1
+
+        offset_index = fd.tell()
+        offsets.tofile(fd)
+        fd.write(FRONT_CODING_TRAILER.pack(
+            offset_index, n, FRONT_CODING_MAGIC
+        ))
+
+
+def read_front_coded(fn: str, first: int = 0) -> Iterator[str]:
+    """
+    Yields the candidates of the front-coded wordlist fn beginning with
+    the block first. The blocks are read one by one using the index,
+    so only a block is kept in memory. Raises ValueError, if fn is not
+    a front-coded wordlist.
+    """
+
+    with open(fn, "rb") as fd:
+        (magic, block) = FRONT_CODING_HEADER.unpack(
+            fd.read(FRONT_CODING_HEADER.size)
+        )
+        fd.seek(-FRONT_CODING_TRAILER.size, os.SEEK_END)
+        (offset_index, n, magic_trailer) = FRONT_CODING_TRAILER.unpack(
+            fd.read(FRONT_CODING_TRAILER.size)
+        )
+        if magic != FRONT_CODING_MAGIC or magic_trailer != magic:
+            raise ValueError("{} is not a front-coded wordlist".format(fn))
+
+        offsets = array("Q")
+        fd.seek(offset_index)
+        offsets.fromfile(fd, -(-n // block))
+        offsets.append(offset_index)
+
+        for i in range(first, len(offsets) - 1):
+            fd.seek(offsets[i])
+            data = fd.read(offsets[i + 1] - offsets[i])
+            pos = 0
+            key = b""
+            while pos < len(data):
+                lengths = []
+                for j in range(2):
+                    length = 0
+                    shift = 0
+                    while True:
+                        b = data[pos]
+                        pos += 1
+                        length |= (b & 0x7f) << shift
+                        shift += 7
+                        if b < 0x80:
+                            break
+                    lengths.append(length)
+                (lcp, length) = lengths
+                key = key[:lcp] + data[pos:pos + length]
+                pos += length
+                yield key.decode("utf-8")[::-1]
+
+
+def is_front_coded(fn: str) -> bool:
+    """
+    Returns whether the file fn begins like a front-coded wordlist.
+    """
+
+    with open(fn, "rb") as fd:
+        return fd.read(len(FRONT_CODING_MAGIC)) == FRONT_CODING_MAGIC
+
+
+class bloom_filter:
+    """
+    Bloom filter of candidates in a memory-mapped file. The positions of
+    the bits of a candidate are computed by double hashing from the two
+    halves of its BLAKE2b digest.
+    """
+
+    def __init__(self, fn, capacity=None, error=None, readonly=False):
+        """
+        Opens the Bloom filter file fn. If it does not exist and the
+        capacity and the false-positive rate error are given, the
+        filter is created sized for capacity candidates.
+        """
+
+        if not os.path.exists(fn) and capacity is not None:
+            self.m = max(math.ceil(
+                -capacity * math.log(error) / math.log(2)**2
+            ), 8)
+            self.k = max(round(self.m / capacity * math.log(2)), 1)
+            with open(fn, "wb") as fd:
+                fd.write(BLOOM_HEADER.pack(BLOOM_MAGIC, self.m, self.k, 0))
+                fd.truncate(BLOOM_HEADER.size + -(-self.m // 8))
+
+        self.fd = open(fn, "rb" if readonly else "r+b")
+        self.mm = mmap.mmap(
+            self.fd.fileno(), 0,
+            access=mmap.ACCESS_READ if readonly else mmap.ACCESS_WRITE
+        )
+        (magic, self.m, self.k, self.n) = BLOOM_HEADER.unpack_from(self.mm)
+        if magic != BLOOM_MAGIC:
+            self.close()
+            raise ValueError("{} is not a Bloom filter".format(fn))
+
+    def get_positions(self, candidate):
+        """
+        Returns the positions of the bits of the candidate.
+        """
+
+        digest = hashlib.blake2b(candidate.encode("utf-8")).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        return [
+            BLOOM_HEADER.size * 8 + (h1 + i * h2) % self.m
+            for i in range(self.k)
+        ]
+
+    def add(self, candidate):
+        """
+        Records the candidate.
+        """
+
+        for pos in self.get_positions(candidate):
+            self.mm[pos >> 3] |= 1 << (pos & 7)
+        self.n += 1
+        BLOOM_HEADER.pack_into(
+            self.mm, 0, BLOOM_MAGIC, self.m, self.k, self.n
+        )
+
+    def __contains__(self, candidate):
+        return all(
+            self.mm[pos >> 3] & (1 << (pos & 7))
+            for pos in self.get_positions(candidate)
+        )
+
+    def close(self):
+        """
+        Writes the changes and closes the file.
+        """
+
+        self.mm.close()
+        self.fd.close()
+
+
+def skip_tried(
+    candidates: Iterable[str], fn: Optional[str]
+) -> Iterator[str]:
+    """
+    Yields the candidates not recorded in the Bloom filter file fn or
+    all candidates, if fn is None.
+    """
+
+    if fn is None:
+        yield from candidates
+        return
+
+    tried = bloom_filter(fn, readonly=True)
+    try:
+        for candidate in candidates:
+            if candidate not in tried:
+                yield candidate
+    finally:
+        tried.close()
+
+
+def usage(fail=True):
+    """
+    This function terminates the program printing usage information.
+    """
+
+    if fail is True:
+        print(__doc__, file=sys.stderr)
+        sys.exit(EXIT_FAILURE)
+    else:
+        print(__doc__)
+        sys.exit(EXIT_SUCCESS)
 
 
 if __name__ == '__main__':
+    # Reading commandline arguments
+    jobs = 1
+    memory = MEMORY_BUDGET
+    merge = False
+    dry_run = False
+    path_checkpoint = None
+    path_tmp = None
+    index_range = None
+    path_rules = None
+    likely = False
+    path_weights = None
+    front_coded = False
+    path_decode = None
+    first = None
+    path_tried = None
+    try:
+        (opts, args) = getopt.getopt(
+            sys.argv[1:], "b:c:D:Fhj:Lm:Mnr:R:s:T:w:"
+        )
+        for opt in opts:
+            if opt[0] == "-b":
+                first = int(opt[1])
+            elif opt[0] == "-c":
+                path_checkpoint = opt[1]
+            elif opt[0] == "-D":
+                path_decode = opt[1]
+            elif opt[0] == "-F":
+                front_coded = True
+            elif opt[0] == "-h":
+                usage(fail=False)
+            elif opt[0] == "-j":
+                jobs = int(opt[1])
+            elif opt[0] == "-L":
+                likely = True
+            elif opt[0] == "-m":
+                memory = int(opt[1])
+            elif opt[0] == "-M":
+                merge = True
+            elif opt[0] == "-n":
+                dry_run = True
+            elif opt[0] == "-r":
+                (start, stop) = opt[1].split("-")
+                index_range = (int(start), int(stop) if stop else None)
+            elif opt[0] == "-R":
+                path_rules = opt[1]
+            elif opt[0] == "-s":
+                path_tried = opt[1]
+            elif opt[0] == "-T":
+                path_tmp = opt[1]
+            elif opt[0] == "-w":
+                path_weights = opt[1]
+            else:
+                raise Exception()
+    except Exception:
+        usage()
+
+    if len(args) > 0 or memory <= 0 or jobs < 1:
+        usage()
+    if path_checkpoint is not None and index_range is None:
+        usage()
+    if path_rules is not None and (
+        jobs > 1 or dry_run is True or index_range is not None
+    ):
+        usage()
+    if likely is True and (
+        jobs > 1 or index_range is not None or path_rules is not None
+    ):
+        usage()
+    if path_weights is not None and likely is False:
+        usage()
+    if front_coded is True and (
+        likely is True or index_range is not None
+        or (jobs > 1 and merge is False)
+    ):
+        usage()
+    if first is not None and path_decode is None:
+        usage()
+    if is_multi(SUBSTITUTES) and (
+        jobs > 1 or likely is True or dry_run is True
+        or index_range is not None
+    ) and path_rules is None:
+        print(
+            "Substitutions of several characters require generation "
+            "without -j, -L, -n and -r", file=sys.stderr
+        )
+        sys.exit(EXIT_FAILURE)
+    if dry_run is True and not is_fixed_length(SUBSTITUTES):
+        print(
+            "Counting requires substitutions of single characters by "
+            "single characters", file=sys.stderr
+        )
+        sys.exit(EXIT_FAILURE)
+
+    if path_tried is not None:
+        try:
+            bloom_filter(path_tried, readonly=True).close()
+        except Exception as err:
+            print(err, file=sys.stderr)
+            sys.exit(EXIT_FAILURE)
+
+    if path_decode is not None:
+        try:
+            for variant in read_front_coded(path_decode, first or 0):
+                sys.stdout.write(variant + "\n")
+        except Exception as err:
+            print(err, file=sys.stderr)
+            sys.exit(EXIT_FAILURE)
+        sys.exit(EXIT_SUCCESS)
+
     # Read passwords to vary
     file_passwords = open(FILE_PASSWORDS, "r")
     pws = file_passwords.read()
     pws = pws.splitlines()
     file_passwords.close()
+    substitutes = canonicalize(SUBSTITUTES)
 
-    # Create wordlist set
-    wordlist = set()
-    for pw in pws:
-        tree = make_tree(pw, SUBSTITUTES)
-        paths = []
-        get_tree_paths(tree, paths)
-        wordlist.update(paths)
-
-    # Write sorted wordlist
-    file_wordlist = open(FILE_WORDLIST, "w")
-    for entry in sorted(wordlist):
-        file_wordlist.write(entry[::-1] + "\n")
-    file_wordlist.close()
+    if path_rules is not None:
+        try:
+            stages = compile_rules(load_rules(path_rules))
+        except Exception as err:
+            print(err, file=sys.stderr)
+            sys.exit(EXIT_FAILURE)
+
+        keys = (
+            v[::-1] for v in skip_tried(apply_rules(pws, stages), path_tried)
+        )
+        write_wordlist(
+            keys, FILE_WORDLIST, memory * 2**20, path_tmp, front_coded
+        )
+        sys.exit(EXIT_SUCCESS)
+
+    if dry_run is True:
+        for pw in pws:
+            print("{:>20} {:>20} {}".format(
+                *count_candidates([pw], substitutes), pw
+            ))
+        print("{:>20} {:>20} total".format(
+            *count_candidates(pws, substitutes)
+        ))
+        sys.exit(EXIT_SUCCESS)
+
+    if likely is True:
+        try:
+            weights = {}
+            if path_weights is not None:
+                weights = load_weights(path_weights)
+        except Exception as err:
+            print(err, file=sys.stderr)
+            sys.exit(EXIT_FAILURE)
+
+        with open(FILE_WORDLIST, "w", encoding="utf-8") as fd:
+            for variant in skip_tried(
+                get_likely_candidates(pws, substitutes, weights), path_tried
+            ):
+                fd.write(variant + "\n")
+        sys.exit(EXIT_SUCCESS)
+
+    if index_range is not None:
+        (start, stop) = index_range
+        if stop is None:
+            stop = get_offsets(pws, substitutes)[-1]
+        index = start
+        if path_checkpoint is not None:
+            try:
+                index = load_checkpoint(path_checkpoint, start, stop)
+            except Exception as err:
+                print(err, file=sys.stderr)
+                sys.exit(EXIT_FAILURE)
+
+        tried = None
+        if path_tried is not None:
+            tried = bloom_filter(path_tried, readonly=True)
+
+        # The checkpoint is written after the candidates before it are
+        # flushed, so no candidate is lost on resumption. An interrupt
+        # is deferred until the current candidate is written and
+        # counted, so the checkpoint records exactly the next index.
+        interrupted = []
+        signal.signal(
+            signal.SIGINT, lambda signum, frame: interrupted.append(signum)
+        )
+        try:
+            for variant in get_range(pws, substitutes, index, stop):
+                if len(interrupted) > 0:
+                    break
+                if tried is None or variant not in tried:
+                    sys.stdout.write(variant + "\n")
+                index += 1
+                if (
+                    path_checkpoint is not None
+                    and index % CHECKPOINT_INTERVAL == 0
+                ):
+                    sys.stdout.flush()
+                    save_checkpoint(path_checkpoint, start, stop, index)
+        finally:
+            if path_checkpoint is not None:
+                sys.stdout.flush()
+                save_checkpoint(path_checkpoint, start, stop, index)
+        sys.exit(EXIT_FAILURE if len(interrupted) > 0 else EXIT_SUCCESS)
+
+    if jobs == 1:
+        # The wordlist is sorted by the reversed candidates
+        if not is_fixed_length(substitutes):
+            variants = get_multi_variants(pws, substitutes, make_automaton(
+                c for c in substitutes if len(c) > 1
+            ))
+        else:
+            variants = get_candidates(make_trie(pws), substitutes)
+        keys = (v[::-1] for v in skip_tried(variants, path_tried))
+        write_wordlist(
+            keys, FILE_WORDLIST, memory * 2**20, path_tmp, front_coded
+        )
+        sys.exit(EXIT_SUCCESS)
+
+    # Write a sorted shard per worker process
+    workers = assign_tasks(
+        get_tasks(pws, substitutes, jobs * TASKS_PER_JOB), jobs
+    )
+    with multiprocessing.Pool(jobs) as pool:
+        shards = pool.starmap(write_shard, [
+            (
+                tasks, substitutes, "{}.{}".format(FILE_WORDLIST, i),
+                memory * 2**20 // jobs, path_tmp, path_tried
+            )
+            for (i, tasks) in enumerate(workers)
+        ])
+
+    # Merge shards, different passwords can have common variants
+    if merge is True:
+        keys = unique(heapq.merge(*[read_shard(fn) for fn in shards]))
+        write_keys(keys, FILE_WORDLIST, front_coded)
+        for fn in shards:
+            os.remove(fn)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Description:
+
+This program benchmarks the evaluation of stat-files by
+stat_conn_eval.py. For each size a synthetic stat-file is generated by
+gen_stat_conn.py and converted to the binary format. Both files are
+evaluated and the throughput and the peak memory allocated during the
+evaluation are printed.
+
+Usage: bench_stat_conn.py [OPTIONS]
+
+Options:
+
+-d <dir>:           Directory for the generated stat-files
+                    (Default: temporary directory)
+
+-h:                 Print usage information
+
+-n <n>[,<n>...]:    Comma-separated list of numbers of measured values
+                    (Default: 10080,100800,525600)
+
+-r <n>:             Number of repetitions, the fastest run is reported
+                    (Default: 3)
+"""
+
+import datetime
+import getopt
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from gen_stat_conn import generate
+from stat_conn_eval import stat_conn
+
+EXIT_SUCCESS = 0
+EXIT_FAILURE = 255
+
+
+def bench(fn, repeat):
+    """
+    This function evaluates the stat-file fn and returns the fastest
+    time of repeat runs in seconds, the peak memory allocated in bytes
+    and the evaluation
+    """
+
+    t_min = None
+    for i in range(repeat):
+        t = time.perf_counter()
+        sc = stat_conn(fn)
+        t = time.perf_counter() - t
+        t_min = t if t_min is None else min(t, t_min)
+
+    # Memory is measured separately, since tracing slows down the
+    # evaluation
+    tracemalloc.start()
+    stat_conn(fn)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return (t_min, peak, sc)
+
+
+def usage(fail=True):
+    """
+    This function terminates the program printing usage information.
+    """
+
+    if fail is True:
+        print(__doc__, file=sys.stderr)
+        sys.exit(EXIT_FAILURE)
+    else:
+        print(__doc__)
+        sys.exit(EXIT_SUCCESS)
+
+
+if __name__ == "__main__":
+    # Reading commandline arguments
+    path_dir = None
+    repeat = 3
+    sizes = [10080, 100800, 525600]
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], "d:hn:r:")
+        for opt in opts:
+            if opt[0] == "-d":
+                path_dir = opt[1]
+            elif opt[0] == "-h":
+                usage(fail=False)
+            elif opt[0] == "-n":
+                sizes = [int(n) for n in opt[1].split(",")]
+            elif opt[0] == "-r":
+                repeat = int(opt[1])
+            else:
+                raise Exception()
+    except Exception:
+        usage()
+
+    if len(args) > 0 or repeat < 1:
+        usage()
+
+    print("{:>10} {:>6} {:>10} {:>8} {:>12} {:>10} {:>10}".format(
+        "values", "format", "size [MB]", "time [s]", "values/s",
+        "MB/s", "peak [MB]"
+    ))
+
+    with tempfile.TemporaryDirectory(dir=path_dir) as path_tmp:
+        for n in sizes:
+            fn = os.path.join(path_tmp, "stat_connectivity_{}".format(n))
+            with open(fn, "w") as fd:
+                generate(
+                    fd, n, datetime.datetime(2024, 1, 1),
+                    0.005, 0.05, 0.01, 0.1, random.Random(0)
+                )
+
+            fn_binary = "{}.bin".format(fn)
+            stat_conn(fn).write_binary(fn_binary)
+
+            for (fmt, path) in [("text", fn), ("binary", fn_binary)]:
+                (t, peak, sc) = bench(path, repeat)
+                size = os.path.getsize(path) / 2**20
+                print(
+                    "{:>10} {:>6} {:>10.2f} {:>8.3f} {:>12.0f} {:>10.2f} "
+                    "{:>10.2f}".format(
+                        sc.n, fmt, size, t, sc.n / t, size / t,
+                        peak / 2**20
+                    ),
+                    flush=True
+                )
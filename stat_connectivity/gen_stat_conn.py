@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Description:
+
+This program generates a synthetic stat-file in the format written by
+stat_connectivity.sh. It is used as test data and as input for the
+benchmark of stat_conn_eval.py. Besides regular measured values the
+stat-file contains RRSIG record lines (also consecutive ones), missing
+measured values and short and long outages of the connectivity and
+the name resolution.
+
+Usage: gen_stat_conn.py [OPTIONS] <file>
+
+Options:
+
+-h:                 Print usage information
+
+-l <p>:             Probability that an outage is a long outage of up
+                    to a day (Default: 0.05)
+
+-m <p>:             Probability that a measured value is missing
+                    (Default: 0.01)
+
+-n <n>:             Number of measured values (Default: 10080)
+
+-o <p>:             Probability that an outage starts at a measured
+                    value (Default: 0.005)
+
+-r <p>:             Probability that RRSIG record lines follow the
+                    name resolution (Default: 0.1)
+
+-s <seed>:          Seed of the random number generator (Default: 0)
+
+-t <time>:          Time of the first measured value as
+                    "dd.mm.yyyy HH:MM" (Default: 01.01.2024 00:00)
+"""
+
+import datetime
+import getopt
+import random
+import sys
+
+EXIT_SUCCESS = 0
+EXIT_FAILURE = 255
+
+# Values of the variables of stat_connectivity.sh
+DN_REF = "example.com"
+IP_REF = "192.0.2.53"
+IP_DN_REF = "198.51.100.1"
+
+TIMESTAMP_FORMAT = "%d.%m.%Y %H:%M"
+
+# Lines written by stat_connectivity.sh
+LINE_CONN = "[{}]Connection to " + IP_REF + " 53 port [tcp/*] succeeded!\n"
+LINE_NO_CONN = "[{}]Connection to " + IP_REF + " cannot be established\n"
+LINE_DN_RES = "[{}]" + DN_REF + " has address " + IP_DN_REF + "\n"
+LINE_NO_DN_RES = "[{}]Name " + IP_REF + " cannot be resolved\n"
+LINE_RRSIG = DN_REF + " has RRSIG record A 13 2 300 20240401000000 " \
+    "20240301000000 12345 " + DN_REF + ". " \
+    "c2lnbmF0dXJlIG9mIHRoZSByZWNvcmQgc2V0IGZvciB0ZXN0aW5n\n"
+
+# Durations of outages in minutes
+DURATION_SHORT = (1, 30)
+DURATION_LONG = (60, 1440)
+
+
+def generate(fd, n, t, p_outage, p_long, p_missing, p_rrsig, rnd):
+    """
+    This function writes n measured values to the file fd beginning at
+    the time t. Outages of the connectivity also interrupt the name
+    resolution, outages of the name resolution can occur on their own.
+    """
+
+    # Remaining minutes of the current outages
+    off_conn = 0
+    off_dn_res = 0
+
+    for i in range(n):
+        if off_conn == 0 and rnd.random() < p_outage:
+            off_conn = rnd.randint(
+                *(DURATION_LONG if rnd.random() < p_long else DURATION_SHORT)
+            )
+        if off_dn_res == 0 and rnd.random() < p_outage:
+            off_dn_res = rnd.randint(
+                *(DURATION_LONG if rnd.random() < p_long else DURATION_SHORT)
+            )
+
+        if rnd.random() >= p_missing:
+            timestamp = t.strftime(TIMESTAMP_FORMAT)
+            if off_conn > 0:
+                fd.write(LINE_NO_CONN.format(timestamp))
+            else:
+                fd.write(LINE_CONN.format(timestamp))
+
+            if off_conn > 0 or off_dn_res > 0:
+                fd.write(LINE_NO_DN_RES.format(timestamp))
+            else:
+                fd.write(LINE_DN_RES.format(timestamp))
+                if rnd.random() < p_rrsig:
+                    fd.write(LINE_RRSIG * rnd.randint(1, 3))
+
+        off_conn = max(off_conn - 1, 0)
+        off_dn_res = max(off_dn_res - 1, 0)
+        t += datetime.timedelta(minutes=1)
+
+
+def usage(fail=True):
+    """
+    This function terminates the program printing usage information.
+    """
+
+    if fail is True:
+        print(__doc__, file=sys.stderr)
+        sys.exit(EXIT_FAILURE)
+    else:
+        print(__doc__)
+        sys.exit(EXIT_SUCCESS)
+
+
+if __name__ == "__main__":
+    # Reading commandline arguments
+    n = 10080
+    p_long = 0.05
+    p_missing = 0.01
+    p_outage = 0.005
+    p_rrsig = 0.1
+    seed = 0
+    t = datetime.datetime(2024, 1, 1)
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], "hl:m:n:o:r:s:t:")
+        for opt in opts:
+            if opt[0] == "-h":
+                usage(fail=False)
+            elif opt[0] == "-l":
+                p_long = float(opt[1])
+            elif opt[0] == "-m":
+                p_missing = float(opt[1])
+            elif opt[0] == "-n":
+                n = int(opt[1])
+            elif opt[0] == "-o":
+                p_outage = float(opt[1])
+            elif opt[0] == "-r":
+                p_rrsig = float(opt[1])
+            elif opt[0] == "-s":
+                seed = int(opt[1])
+            elif opt[0] == "-t":
+                t = datetime.datetime.strptime(opt[1], TIMESTAMP_FORMAT)
+            else:
+                raise Exception()
+    except Exception:
+        usage()
+
+    if len(args) != 1:
+        usage()
+
+    try:
+        with open(args[0], "w") as fd:
+            generate(
+                fd, n, t, p_outage, p_long, p_missing, p_rrsig,
+                random.Random(seed)
+            )
+    except Exception as err:
+        print(err, file=sys.stderr)
+        sys.exit(EXIT_FAILURE)
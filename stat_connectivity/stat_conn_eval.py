@@ -2,15 +2,269 @@
 # -*- coding: utf-8 -*-
 
 """
-Usage: stat_conn_eval.py <file>
+Description:
+
+This program evaluates the stat-files produced by stat_connectivity.sh.
+For each stat-file the percentage of measured values without
+connectivity and without name resolution and the time periods of the
+outages are printed.
+
+The lines for the connectivity and the name resolution of a measured
+value are joined by their timestamp. Lines which are not joined within
+a window of some minutes, e.g. because a line was dropped or cron runs
+overlapped, are reported as unmatched.
+
+Besides the text format written by stat_connectivity.sh, stat-files
+can be stored in a compact binary format. It consists of an 8 byte
+header followed by a record of 8 bytes for each measured value:
+
+- Minutes since the epoch (uint32, little endian)
+- Status bits (uint8): 0x1 no connectivity, 0x2 no name resolution
+- Padding (uint8)
+- Latency in ms (uint16, little endian, 0xffff if unknown)
+
+Binary stat-files are detected automatically and evaluated by memory
+mapping the file.
+
+Usage: stat_conn_eval.py [OPTIONS] <file> [<file> ...]
+
+Options:
+
+-c <binfile>:       Convert the stat-file to the binary format and
+                    write it to binfile instead of printing the results
+
+-d <database>:      Ingest the measured values of the stat-files into the
+                    specified SQLite database instead of printing the
+                    results. Only the measured values after the last
+                    ingested timestamp of a stat-file are inserted.
+
+-f, --follow:       Follow the stat-file after the evaluation and print
+                    an event for each start and end of an outage of
+                    the connectivity or the name resolution as soon as
+                    it is appended to the stat-file
+
+-h:                 Print usage information
+
+-H:                 Print the percentage of offline values binned by
+                    hour of day and weekday and by day of month instead
+                    of the results. The output format can be "text",
+                    "csv" or "json".
+
+-j <n>:             Decompress up to n rotated stat-files in parallel
+                    (Default: 1)
+
+-J <minutes>:       Window in minutes to join the lines of a measured
+                    value (Default: 5)
+
+-m:                 The stat-files were written by different hosts. They
+                    are merged by timestamp while they are read and
+                    besides the results of each host the results for
+                    the time periods where all hosts or some hosts were
+                    offline are printed. A host is considered to keep
+                    its status until its next measured value.
+
+-o <format>:        Output format of the results: "text" or "json"
+                    (Default: text)
+
+-p <textfile>:      Write the results as metrics in the text format of
+                    Prometheus to the specified file, e.g. for the
+                    textfile collector of the node exporter. The file is
+                    replaced atomically. Combined with -s only the new
+                    lines are evaluated on each run, combined with -f
+                    the file is updated on every appended measurement.
+
+-q:                 Query the results from the SQLite database given by
+                    -d instead of evaluating stat-files. The arguments
+                    are the names of the ingested stat-files.
+
+-r:                 The stat-files are rotated parts of a single
+                    stat-file, e.g. "/var/log/stat_connectivity*". They
+                    are ordered chronologically and evaluated as one
+                    continuous timeline. Compressed parts (gzip, xz,
+                    bzip2) are decompressed on the fly.
+
+-s <statefile>:     Checkpoint the evaluation in the specified state
+                    file. The next run resumes at the last processed
+                    position of the stat-file and only parses the new
+                    lines. If the stat-file was truncated or rotated in
+                    the meantime, the evaluation restarts from the
+                    beginning. Only a single stat-file can be evaluated
+                    using this option.
+
+-w <window>:        Print the availability for the specified time window
+                    instead of the whole evaluation. The option can be
+                    given multiple times. A window is one of:
+                    - <n>d, <n>h, <n>m: The last n days, hours or
+                      minutes of the measurement, e.g. "7d"
+                    - yyyy, yyyy-mm, yyyy-mm-dd: A year, a month or a
+                      day, e.g. "2024-03"
+                    - <from>..<to>: The time from the beginning of the
+                      first to the end of the second of the periods
+                      above, e.g. "2024-03..2024-05"
+
+-x <command>:       Execute the specified command for each event in
+                    follow mode instead of printing it. The command is
+                    called with the arguments <event> <check> <time>,
+                    e.g. "start connectivity 01.03.2024 10:01". Failures
+                    of the command are reported on STDERR.
 """
 
+from array import array
+import bisect
+import bz2
+import concurrent.futures
+import datetime
+import getopt
+import glob
+import gzip
+import heapq
+import json
+import lzma
+import io
+import itertools
+import math
+import mmap
+import os
 import re
+import shutil
+import sqlite3
+import struct
+import subprocess
 import sys
+import tempfile
+import time
 
 EXIT_SUCCESS = 0
 EXIT_FAILURE = 255
 
+# Version of the format of the state file
+STATE_VERSION = 5
+
+# Window in minutes to join the lines of a measured value
+JOIN_WINDOW = 5
+
+# Regular expressions to split a line of a stat-file into timestamp and
+# output of the check and to detect the output of the connectivity
+# check (nc or the message of stat_connectivity.sh)
+REGEX_LINE = re.compile(
+    r"^\[([0-9]{2}\.[0-9]{2}\.[0-9]{4} [0-9]{2}:[0-9]{2})\](.*)$"
+)
+REGEX_LINE_CONN = re.compile(
+    r"^(Connection to |Ncat: |\S+ \[[0-9a-fA-F.:]+\] 53 )"
+)
+
+# Minimal and maximal time in seconds to wait for new lines in follow
+# mode. The time is doubled each time no new line was found.
+FOLLOW_WAIT_MIN = 0.05
+FOLLOW_WAIT_MAX = 0.5
+
+# Names of the checks used in outage events
+CHECK_CONN = "connectivity"
+CHECK_DN_RES = "name_resolution"
+
+# Timestamps are stored as minutes since 01.01.1970 00:00 of the local
+# time used in the stat-file
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+TIMESTAMP_FORMAT = "%d.%m.%Y %H:%M"
+
+# Magic numbers of compressed stat-files and the corresponding
+# decompressors
+COMPRESSORS = [
+    (b"\x1f\x8b", gzip.GzipFile),
+    (b"\xfd7zXZ\x00", lzma.LZMAFile),
+    (b"BZh", bz2.BZ2File)
+]
+
+# Header and size of records of binary stat-files
+BINARY_MAGIC = b"SCNB"
+BINARY_VERSION = 1
+BINARY_HEADER = BINARY_MAGIC + struct.pack("<HH", BINARY_VERSION, 0)
+BINARY_RECORD = "<IBxH"
+BINARY_RECORD_SIZE = struct.calcsize(BINARY_RECORD)
+
+# Number of records of binary stat-files read at once when streaming
+BINARY_CHUNK = 4096
+
+# Status bits of records of binary stat-files and the tables to extract
+# them from the status bytes
+BINARY_OFF_CONN = 0x1
+BINARY_OFF_DN_RES = 0x2
+BINARY_TABLE_CONN = bytes(
+    [1 if i & BINARY_OFF_CONN else 0 for i in range(256)]
+)
+BINARY_TABLE_DN_RES = bytes(
+    [1 if i & BINARY_OFF_DN_RES else 0 for i in range(256)]
+)
+
+# Latency of records of binary stat-files, if it is unknown
+BINARY_LATENCY_UNKNOWN = 0xffff
+
+# Number of measured values inserted into the database per transaction
+INGEST_BATCH = 10000
+
+# Schema of the database of measured values. A row is stored for each
+# measured value of a stat-file (host).
+SQL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    host TEXT NOT NULL,
+    t INTEGER NOT NULL,
+    is_connected INTEGER NOT NULL,
+    is_dn_resolved INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS samples_host_t ON samples (host, t);
+"""
+
+# Queries of the database of measured values
+SQL_INSERT = "INSERT INTO samples VALUES (?, ?, ?, ?)"
+SQL_RANGE = "SELECT min(t), max(t) FROM samples WHERE host = ?"
+SQL_COUNT = """
+SELECT count(*), total(1 - is_connected), total(1 - is_dn_resolved)
+FROM samples WHERE host = ? AND t >= ? AND t < ?
+"""
+SQL_CHANGES = """
+SELECT t, {0} FROM (
+    SELECT t, {0}, lag({0}, 1, ?) OVER (ORDER BY t) AS prev
+    FROM samples WHERE host = ? AND t >= ? AND t < ?
+) WHERE {0} != prev ORDER BY t
+"""
+SQL_STATUS_BEFORE = """
+SELECT {0} FROM samples WHERE host = ? AND t < ? ORDER BY t DESC LIMIT 1
+"""
+SQL_OUTAGE_BEG = """
+SELECT min(t) FROM samples WHERE host = ? AND t < ? AND t > coalesce(
+    (SELECT max(t) FROM samples WHERE host = ? AND t < ? AND {0} = 1), -1
+)
+"""
+SQL_OUTAGE_END = """
+SELECT min(t) FROM samples WHERE host = ? AND t >= ? AND {0} = 1
+"""
+
+# Causes of outages of the name resolution
+CAUSE_CONN = "connectivity"
+CAUSE_PARTIAL = "partial"
+CAUSE_DN_RES = "dns_only"
+CAUSES = {
+    CAUSE_CONN: "caused by connectivity loss",
+    CAUSE_PARTIAL: "partially overlapping",
+    CAUSE_DN_RES: "DNS only"
+}
+
+# Upper bounds of the buckets of the histogram of outage durations in
+# minutes
+HISTOGRAM_BUCKETS = [1, 5, 15, 30, 60, 180, 720, 1440]
+
+# Labels of the rows and columns of the heatmaps
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+HOURS = ["{:02d}".format(h) for h in range(24)]
+DAYS = ["{:02d}".format(d) for d in range(1, 32)]
+
+# Units of relative time windows in minutes
+WINDOW_UNITS = {
+    "d": 1440,
+    "h": 60,
+    "m": 1
+}
+
 
 class stat_conn:
     """
@@ -18,104 +272,482 @@ class stat_conn:
     was produced by stat_connectivity.sh
     """
 
-    def __init__(self, fn):
+    def __init__(
+        self, fn, path_state=None, parts=None, jobs=1, values=None,
+        join_window=JOIN_WINDOW, follow=False
+    ):
         """
         The constructor reads the stat-file produced from
-        stat_connectivity.sh and extracts values for each timestamp
+        stat_connectivity.sh and extracts values for each timestamp.
+        If a state file is given, the evaluation resumes at the
+        position stored in the state file and the state file is
+        updated afterwards. If a list of rotated parts is given, the
+        parts are evaluated as one stat-file using up to jobs threads
+        for the decompression. If an iterable of measured values
+        (t, is_connected, is_dn_resolved) is given, they are evaluated
+        instead of reading the stat-file. The lines of a measured value
+        are joined within join_window minutes. If the stat-file will be
+        followed, lines which are not joined yet are kept.
         """
 
         try:
             self.name = fn
+            self.path_state = path_state
+            self.join_window = join_window
+            self.on_event = None
+            self.on_update = None
+            self.reset()
 
-            # Read stat-file
-            fd = open(fn, "r")
-            lines = fd.read()
-            lines = lines.split("\n")[:-1]
-            fd.close()
+            if self.path_state is not None:
+                self.load_state()
 
-            # Remove RRSIG record entries
-            for line in lines:
-                regex = r"^.*RRSIG record.*$"
-                if re.search(regex, line) is not None:
-                    lines.remove(line)
+            if values is not None:
+                for v in values:
+                    self.add(*v)
+            elif parts is None:
+                self.read()
+            else:
+                self.read_parts(parts, jobs)
 
-            # Extract results:
-            # Number of measurement values
-            self.n = int(len(lines) / 2)
+            # Without a state file and without following no more lines
+            # will be joined
+            if self.path_state is not None:
+                self.save_state()
+            elif follow is False:
+                self.flush()
 
-            # Number of measurement values with no connectivity
-            n_off_conn = 0
+        except Exception as err:
+            error(err)
 
-            # Number of measurement values with no domain name resolution
-            n_off_dn_res = 0
+    def reset(self):
+        """
+        Resets the evaluation to the beginning of the stat-file
+        """
 
-            # Time periods with no connectivity
-            self.off_conn = []
+        # Position in stat-file up to which the lines were evaluated
+        self.offset = 0
 
-            # Time periods with no domain name resolution
-            self.off_dn_res = []
+        # Inode and size of the stat-file at the time of the evaluation
+        self.inode = None
+        self.size = 0
 
-            # Set start time of measurement
-            self.t_beg = self.get_timestamp(lines[0])
+        # Number of measured values stored in the index of the state
+        self.n_saved = 0
 
-            # Set end time of measurement
-            self.t_end = self.get_timestamp(lines[-1])
+        # Lines which are not joined yet
+        self.join = stat_conn_join(self.join_window)
 
-            # Flag to monitor change of connectivity status
-            is_conn = True
+        # Number of measurement values
+        self.n = 0
 
-            # Flag to monitor change of domain name resolution status
-            is_dn_res = True
+        # Number of measurement values with no connectivity
+        self.n_off_conn = 0
 
-            for i in range(0, len(lines), 2):
-                # Parse entries for timestamp
-                v = {
-                    "is_connected": self.is_connected(lines[i]),
-                    "is_dn_resolved": self.is_dn_resolved(lines[i + 1]),
-                    "t": self.get_timestamp(lines[i])
-                }
+        # Number of measurement values with no domain name resolution
+        self.n_off_dn_res = 0
 
-                # Increment if no connection
-                if v["is_connected"] is False:
-                    n_off_conn += 1
-
-                # Increment if no name resolution
-                if v["is_dn_resolved"] is False:
-                    n_off_dn_res += 1
-
-                # Monitor timestamps on connection state change
-                if is_conn is not v["is_connected"]:
-                    if is_conn is True:
-                        # Connection lost
-                        is_conn = False
-                        self.off_conn.append({
-                            "t_beg": v["t"]
-                        })
-                    else:
-                        # Connection restored
-                        is_conn = True
-                        self.off_conn[-1]["t_end"] = v["t"]
-
-                # Monitor timestamps on name resolution state change
-                if is_dn_res is not v["is_dn_resolved"]:
-                    if is_dn_res is True:
-                        # Ability for name resolution lost
-                        is_dn_res = False
-                        self.off_dn_res.append({
-                            "t_beg": v["t"]
-                        })
-                    else:
-                        # Ability for name resolution restored
-                        is_dn_res = True
-                        self.off_dn_res[-1]["t_end"] = v["t"]
+        # Time periods with no connectivity
+        self.off_conn = []
 
-            self.perc_off_conn = float(100 * n_off_conn / self.n)
-            self.perc_off_dn_res = float(100 * n_off_dn_res / self.n)
+        # Time periods with no domain name resolution
+        self.off_dn_res = []
 
-        except Exception as err:
-            error(err)
+        # Start and end time of measurement
+        self.t_beg = None
+        self.t_end = None
+
+        # Timestamps of the measured values and prefix sums of the
+        # measured values with no connectivity and no domain name
+        # resolution used to answer queries for time windows
+        self.t = array("i")
+        self.cum_off_conn = array("I", [0])
+        self.cum_off_dn_res = array("I", [0])
+
+        # Flag to monitor change of connectivity status
+        self.is_conn = True
+
+        # Flag to monitor change of domain name resolution status
+        self.is_dn_res = True
 
-    def is_connected(self, line):
+    def read(self, keep_state=False):
+        """
+        Reads the lines of the stat-file, which were appended since the
+        last evaluation. Each measurement consists of a line for the
+        connectivity followed by a line for the name resolution. The
+        offset is only advanced for complete measurements, so that a
+        measurement currently written is evaluated on the next run.
+        If keep_state is set, a rotated stat-file is treated as the
+        continuation of the previous one instead of restarting the
+        evaluation and a missing stat-file is treated as currently
+        rotated. Returns the number of new measured values.
+        """
+
+        n = self.n
+        try:
+            raw = open(self.name, "rb")
+        except FileNotFoundError:
+            if keep_state is True:
+                # Stat-file is currently rotated
+                return 0
+            raise
+
+        with raw:
+            st = os.fstat(raw.fileno())
+            fd = open_log(raw)
+
+            # Restart, if the stat-file was rotated or truncated. The
+            # size of compressed stat-files does not correspond to the
+            # offset.
+            if st.st_ino != self.inode \
+                    or (fd is raw and st.st_size < self.offset):
+                if keep_state is True and self.inode is not None:
+                    self.offset = 0
+                else:
+                    self.reset()
+                self.inode = st.st_ino
+
+            self.parse_any(fd)
+            self.size = st.st_size
+
+        return self.n - n
+
+    def read_parts(self, parts, jobs=1):
+        """
+        Reads the rotated parts of a stat-file as one continuous
+        timeline. The parts are ordered by their first timestamp, so
+        outages spanning the rotation are counted once. Compressed
+        parts are decompressed by up to jobs threads in advance.
+        """
+
+        parts = sort_parts(parts)
+        with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+            for fd in executor.map(decompress, parts):
+                with fd:
+                    self.offset = 0
+                    self.parse_any(fd)
+
+    def parse_any(self, fd):
+        """
+        Parses the opened stat-file fd starting at the offset. Binary
+        stat-files are memory mapped, if possible, otherwise they are
+        read completely.
+        """
+
+        fd.seek(0)
+        is_binary = read_binary_header(fd)
+        fd.seek(self.offset)
+        if is_binary is False:
+            self.parse(fd)
+        elif isinstance(fd, (io.BufferedReader, io.BufferedRandom)):
+            with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                self.parse_binary(buf)
+        else:
+            fd.seek(0)
+            self.parse_binary(fd.read())
+
+    def parse_binary(self, buf):
+        """
+        Parses the records of a binary stat-file in the buffer buf
+        starting at the offset. The timestamps and status bits are
+        extracted from the buffer as a whole and the outages are found
+        as runs of offline values, so no record is handled separately.
+        """
+
+        offset = max(self.offset, len(BINARY_HEADER))
+        n = (len(buf) - offset) // BINARY_RECORD_SIZE
+        if n <= 0:
+            return
+
+        end = offset + n * BINARY_RECORD_SIZE
+        with memoryview(buf)[offset:end] as records:
+            t = array("i")
+            with records.cast("I") as words:
+                t.frombytes(words[0::2].tobytes())
+            status = records[4::BINARY_RECORD_SIZE].tobytes()
+
+        if sys.byteorder == "big":
+            t.byteswap()
+
+        off_conn = status.translate(BINARY_TABLE_CONN)
+        off_dn_res = status.translate(BINARY_TABLE_DN_RES)
+
+        self.is_conn = self.add_outages(
+            self.off_conn, self.is_conn, off_conn, t, CHECK_CONN
+        )
+        self.is_dn_res = self.add_outages(
+            self.off_dn_res, self.is_dn_res, off_dn_res, t, CHECK_DN_RES
+        )
+
+        self.t.extend(t)
+        self.cum_off_conn.extend(
+            itertools.accumulate(off_conn, initial=self.n_off_conn)
+        )
+        del self.cum_off_conn[self.n + 1]
+        self.cum_off_dn_res.extend(
+            itertools.accumulate(off_dn_res, initial=self.n_off_dn_res)
+        )
+        del self.cum_off_dn_res[self.n + 1]
+
+        self.n += n
+        self.n_off_conn = self.cum_off_conn[-1]
+        self.n_off_dn_res = self.cum_off_dn_res[-1]
+        if self.t_beg is None:
+            self.t_beg = t[0]
+        self.t_end = t[-1]
+        self.offset = end
+
+    def add_outages(self, outages, is_on, off, t, check):
+        """
+        Adds the outages given by runs of offline values in off to the
+        list of outages. The byte string off contains 1 for each
+        measured value at the timestamps t, which was offline. is_on is
+        the status before the first value. Returns the status after the
+        last value.
+        """
+
+        # Outage continued from the previous values is restored
+        if is_on is False and off[0] == 0:
+            outages[-1]["t_end"] = t[0]
+            self.notify("end", check, t[0])
+
+        for m in re.finditer(rb"\x01+", off):
+            (i, j) = m.span()
+            if i > 0 or is_on is True:
+                outages.append({
+                    "t_beg": t[i]
+                })
+                self.notify("start", check, t[i])
+            if j < len(off):
+                outages[-1]["t_end"] = t[j]
+                self.notify("end", check, t[j])
+
+        return off[-1] == 0
+
+    def write_binary(self, fn):
+        """
+        Writes the measured values of the evaluation to the binary
+        stat-file fn
+        """
+
+        status = array("I", [
+            BINARY_LATENCY_UNKNOWN << 16
+            | (BINARY_OFF_CONN if c_1 > c_0 else 0)
+            | (BINARY_OFF_DN_RES if d_1 > d_0 else 0)
+            for (c_0, c_1, d_0, d_1) in zip(
+                self.cum_off_conn, self.cum_off_conn[1:],
+                self.cum_off_dn_res, self.cum_off_dn_res[1:]
+            )
+        ])
+
+        records = array("I", bytes(BINARY_RECORD_SIZE * self.n))
+        records[0::2] = array("I", self.t.tobytes())
+        records[1::2] = status
+        if sys.byteorder == "big":
+            records.byteswap()
+
+        path_tmp = "{}.tmp".format(fn)
+        with open(path_tmp, "wb") as fd:
+            fd.write(BINARY_HEADER)
+            records.tofile(fd)
+        os.replace(path_tmp, fn)
+
+    def parse(self, fd):
+        """
+        Parses the lines of the opened stat-file fd. The lines are
+        joined to measured values by their timestamp. Lines which are
+        not joined yet are kept in the join and stored in the state.
+        """
+
+        for line in fd:
+            # Incomplete line which is currently written
+            if not line.endswith(b"\n"):
+                break
+
+            self.offset += len(line)
+            for v in self.join.add(line.decode(errors="replace")):
+                self.add(*v)
+
+    def flush(self):
+        """
+        Evaluates the measured values kept back by the join and reports
+        the lines, which are not joined yet, as unmatched
+        """
+
+        for v in self.join.release(flush=True):
+            self.add(*v)
+
+    def add(self, t, is_connected, is_dn_resolved):
+        """
+        Adds a measured value to the evaluation and monitors the
+        changes of the connectivity and the name resolution status.
+        """
+
+        self.n += 1
+        if self.t_beg is None:
+            self.t_beg = t
+        self.t_end = t
+
+        # Increment if no connection
+        if is_connected is False:
+            self.n_off_conn += 1
+
+        # Increment if no name resolution
+        if is_dn_resolved is False:
+            self.n_off_dn_res += 1
+
+        self.t.append(t)
+        self.cum_off_conn.append(self.n_off_conn)
+        self.cum_off_dn_res.append(self.n_off_dn_res)
+
+        # Monitor timestamps on connection state change
+        if self.is_conn is not is_connected:
+            if self.is_conn is True:
+                # Connection lost
+                self.is_conn = False
+                self.off_conn.append({
+                    "t_beg": t
+                })
+                self.notify("start", CHECK_CONN, t)
+            else:
+                # Connection restored
+                self.is_conn = True
+                self.off_conn[-1]["t_end"] = t
+                self.notify("end", CHECK_CONN, t)
+
+        # Monitor timestamps on name resolution state change
+        if self.is_dn_res is not is_dn_resolved:
+            if self.is_dn_res is True:
+                # Ability for name resolution lost
+                self.is_dn_res = False
+                self.off_dn_res.append({
+                    "t_beg": t
+                })
+                self.notify("start", CHECK_DN_RES, t)
+            else:
+                # Ability for name resolution restored
+                self.is_dn_res = True
+                self.off_dn_res[-1]["t_end"] = t
+                self.notify("end", CHECK_DN_RES, t)
+
+    def notify(self, event, check, t):
+        """
+        Passes the start or the end of an outage to the event handler
+        """
+
+        if self.on_event is not None:
+            self.on_event(event, check, format_timestamp(t))
+
+    def follow(self):
+        """
+        Follows the stat-file and evaluates the appended lines until
+        the program is interrupted. If no new lines were found, the
+        time to wait before the next read is doubled up to
+        FOLLOW_WAIT_MAX, so the stat-file is not polled permanently
+        while the latency stays below a second.
+        """
+
+        wait = FOLLOW_WAIT_MIN
+        while True:
+            n = self.read(keep_state=True)
+            if n > 0:
+                wait = FOLLOW_WAIT_MIN
+                if self.path_state is not None:
+                    self.save_state()
+                if self.on_update is not None:
+                    self.on_update()
+            else:
+                time.sleep(wait)
+                wait = min(2 * wait, FOLLOW_WAIT_MAX)
+
+    def load_state(self):
+        """
+        Loads the state of a previous evaluation from the state file.
+        If the state file does not exist yet or belongs to another
+        stat-file, the evaluation starts from the beginning.
+        """
+
+        if not os.path.exists(self.path_state):
+            return
+
+        with open(self.path_state, "r") as fd:
+            state = json.load(fd)
+
+        if state.get("version") != STATE_VERSION \
+                or state.get("name") != os.path.abspath(self.name):
+            return
+
+        # The index of the measured values must contain the values of
+        # the state. It consists of the timestamp and the prefix sums
+        # for each measured value.
+        path_index = "{}.idx".format(self.path_state)
+        if not os.path.exists(path_index):
+            return
+
+        index = array("I")
+        with open(path_index, "rb") as fd:
+            try:
+                index.fromfile(fd, 3 * state["n"])
+            except EOFError:
+                return
+
+        self.t.frombytes(index[0::3].tobytes())
+        self.cum_off_conn.extend(index[1::3])
+        self.cum_off_dn_res.extend(index[2::3])
+        self.n_saved = state["n"]
+
+        for key in [
+            "offset", "inode", "size", "n", "n_off_conn", "n_off_dn_res",
+            "off_conn", "off_dn_res", "t_beg", "t_end", "is_conn",
+            "is_dn_res"
+        ]:
+            setattr(self, key, state[key])
+        self.join.set_state(state["join"])
+
+    def save_state(self):
+        """
+        Writes the state of the evaluation to the state file. The file
+        is replaced atomically, so that an interrupted run never leaves
+        a corrupted state file behind.
+        """
+
+        state = {
+            "version": STATE_VERSION,
+            "name": os.path.abspath(self.name),
+            "offset": self.offset,
+            "inode": self.inode,
+            "size": self.size,
+            "n": self.n,
+            "n_off_conn": self.n_off_conn,
+            "n_off_dn_res": self.n_off_dn_res,
+            "off_conn": self.off_conn,
+            "off_dn_res": self.off_dn_res,
+            "t_beg": self.t_beg,
+            "t_end": self.t_end,
+            "is_conn": self.is_conn,
+            "is_dn_res": self.is_dn_res,
+            "join": self.join.get_state()
+        }
+
+        # Only the new measured values are appended to the index. Values
+        # of an interrupted run, which are not part of the state, are
+        # truncated before.
+        path_index = "{}.idx".format(self.path_state)
+        index = array("I", bytes(12 * (self.n - self.n_saved)))
+        index[0::3] = array("I", self.t[self.n_saved:].tobytes())
+        index[1::3] = self.cum_off_conn[self.n_saved + 1:]
+        index[2::3] = self.cum_off_dn_res[self.n_saved + 1:]
+        with open(path_index, "ab") as fd:
+            fd.truncate(12 * self.n_saved)
+            index.tofile(fd)
+        self.n_saved = self.n
+
+        path_tmp = "{}.tmp".format(self.path_state)
+        with open(path_tmp, "w") as fd:
+            json.dump(state, fd)
+        os.replace(path_tmp, self.path_state)
+
+    @staticmethod
+    def is_connected(line):
         """
         Extracts from a line of stat-file, if connection to reference
         ip was possible.
@@ -127,7 +759,8 @@ class stat_conn:
         else:
             return False
 
-    def is_dn_resolved(self, line):
+    @staticmethod
+    def is_dn_resolved(line):
         """
         Extracts from a line of stat-file, if reference domain name
         could be resolved.
@@ -139,45 +772,1154 @@ class stat_conn:
         else:
             return False
 
-    def get_timestamp(self, line):
+    def get_window(self, t_from, t_to):
+        """
+        Returns the number of measured values and the numbers of
+        measured values with no connectivity and no domain name
+        resolution in the time window [t_from, t_to). The values are
+        looked up by binary search in the timestamps and the prefix
+        sums, so the stat-file is not parsed again.
+        """
+
+        i = bisect.bisect_left(self.t, t_from)
+        j = bisect.bisect_left(self.t, t_to)
+        return (
+            j - i,
+            self.cum_off_conn[j] - self.cum_off_conn[i],
+            self.cum_off_dn_res[j] - self.cum_off_dn_res[i]
+        )
+
+    def get_outages(self, outages, t_from, t_to):
+        """
+        Returns the outages of the sorted list outages, which overlap
+        the time window [t_from, t_to)
+        """
+
+        i = bisect.bisect_right(
+            outages, t_from,
+            key=lambda e: e.get("t_end", float("inf"))
+        )
+        j = bisect.bisect_left(outages, t_to, key=lambda e: e["t_beg"])
+        return outages[i:j]
+
+    def get_stats(self, outages, t_from, t_to):
+        """
+        Returns the statistics of the durations of the outages clipped
+        to the time window [t_from, t_to]. Outages which have not
+        ended yet last until the last measured value. The durations,
+        the mean time between failures (MTBF) and the mean time to
+        recovery (MTTR) are given in minutes.
+        """
+
+        t_last = min(t_to, self.t_end)
+        durations = sorted([
+            min(e.get("t_end", t_last), t_to) - max(e["t_beg"], t_from)
+            for e in outages
+        ])
+
+        n = len(durations)
+        total = sum(durations)
+        histogram = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        for d in durations:
+            histogram[bisect.bisect_left(HISTOGRAM_BUCKETS, d)] += 1
+
+        return {
+            "count": n,
+            "total": total,
+            "mean": total / n if n > 0 else 0.0,
+            "median": (
+                durations[(n - 1) // 2] + durations[n // 2]
+            ) / 2 if n > 0 else 0.0,
+            "p95": durations[math.ceil(0.95 * n) - 1] if n > 0 else 0,
+            "max": durations[-1] if n > 0 else 0,
+            "mtbf": (t_to - t_from - total) / n if n > 0 else None,
+            "mttr": total / n if n > 0 else None,
+            "histogram": [
+                {"le": le, "count": count}
+                for (le, count) in zip(
+                    HISTOGRAM_BUCKETS + [None], histogram
+                )
+            ]
+        }
+
+    def get_results(self, window=None):
+        """
+        Returns the results of the evaluation as dictionary. If the
+        string window is given, the results are restricted to the
+        specified time window.
+        """
+
+        if window is None:
+            (t_from, t_to) = (self.t_beg, self.t_end)
+            (n, n_off_conn, n_off_dn_res) = \
+                (self.n, self.n_off_conn, self.n_off_dn_res)
+            off_conn = self.off_conn
+            off_dn_res = self.off_dn_res
+        else:
+            (t_from, t_to) = parse_window(window, self.t_end)
+            if t_from is None:
+                return self.make_results(
+                    window, None, None, 0, 0, 0, [], [], []
+                )
+            (n, n_off_conn, n_off_dn_res) = self.get_window(t_from, t_to)
+            off_conn = self.get_outages(self.off_conn, t_from, t_to)
+            off_dn_res = self.get_outages(self.off_dn_res, t_from, t_to)
+
+        return self.make_results(
+            window, t_from, t_to, n, n_off_conn, n_off_dn_res,
+            off_conn, off_dn_res,
+            [
+                (check, t) for (check, t) in self.join.unmatched
+                if window is None or t_from <= t < t_to
+            ]
+        )
+
+    def make_results(
+        self, window, t_from, t_to, n, n_off_conn, n_off_dn_res,
+        off_conn, off_dn_res, unmatched
+    ):
+        """
+        Returns the dictionary of results for the time window
+        [t_from, t_to] from the numbers of measured values, the outages
+        and the unmatched lines
+        """
+
+        if n == 0:
+            return {
+                "name": self.name,
+                "window": window,
+                "t_beg": format_timestamp(t_from),
+                "t_end": format_timestamp(t_to),
+                "n": 0
+            }
+
+        (causes, correlation) = self.get_correlation(
+            off_conn, off_dn_res, t_from, t_to
+        )
+
+        return {
+            "name": self.name,
+            "window": window,
+            "t_beg": format_timestamp(t_from),
+            "t_end": format_timestamp(t_to),
+            "n": n,
+            "perc_off_conn": float(100 * n_off_conn / n),
+            "perc_off_dn_res": float(100 * n_off_dn_res / n),
+            "off_conn": [
+                {
+                    "t_beg": format_timestamp(e["t_beg"]),
+                    "t_end": format_timestamp(e.get("t_end"))
+                }
+                for e in off_conn
+            ],
+            "off_dn_res": [
+                {
+                    "t_beg": format_timestamp(e["t_beg"]),
+                    "t_end": format_timestamp(e.get("t_end")),
+                    "cause": cause
+                }
+                for (e, cause) in zip(off_dn_res, causes)
+            ],
+            "stats": {
+                CHECK_CONN: self.get_stats(off_conn, t_from, t_to),
+                CHECK_DN_RES: self.get_stats(off_dn_res, t_from, t_to)
+            },
+            "correlation": correlation,
+            "unmatched": [
+                {
+                    "check": check,
+                    "t": format_timestamp(t)
+                }
+                for (check, t) in unmatched
+            ]
+        }
+
+    def get_correlation(self, off_conn, off_dn_res, t_from, t_to):
+        """
+        Classifies each outage of the name resolution by its overlap
+        with the outages of the connectivity within the time window
+        [t_from, t_to] as caused by the connectivity, partially
+        overlapping or affecting only the name resolution. Both lists
+        of outages are sorted and disjoint, so a single sweep over
+        both lists is sufficient. Returns the list of causes and the
+        number of outages for each cause with the total overlap in
+        minutes.
+        """
+
+        # Outages are handled as half-open intervals [t_beg, t_end) of
+        # offline values, outages which have not ended yet include the
+        # last measured value
+        t_stop = self.t_end + 1 if t_to >= self.t_end else t_to
+
+        def clip(e):
+            return (
+                max(e["t_beg"], t_from),
+                min(e.get("t_end", t_stop), t_stop)
+            )
+
+        conn = [clip(e) for e in off_conn]
+        causes = []
+        correlation = {
+            CAUSE_CONN: 0,
+            CAUSE_PARTIAL: 0,
+            CAUSE_DN_RES: 0,
+            "overlap": 0
+        }
+
+        i = 0
+        for e in off_dn_res:
+            (t_beg, t_end) = clip(e)
+
+            # Skip outages of the connectivity ending before this outage
+            while i < len(conn) and conn[i][1] <= t_beg:
+                i += 1
+
+            overlap = 0
+            j = i
+            while j < len(conn) and conn[j][0] < t_end:
+                overlap += min(t_end, conn[j][1]) - max(t_beg, conn[j][0])
+                j += 1
+
+            # Outages of the connectivity are never adjacent, so the
+            # outage is covered, if the overlap is its duration
+            covered = overlap > 0 and overlap == t_end - t_beg
+
+            if covered is True:
+                cause = CAUSE_CONN
+            elif overlap > 0:
+                cause = CAUSE_PARTIAL
+            else:
+                cause = CAUSE_DN_RES
+
+            causes.append(cause)
+            correlation[cause] += 1
+            correlation["overlap"] += overlap
+
+        return (causes, correlation)
+
+    def get_heatmap(self, window=None):
         """
-        Extracts timestamp from a line of a stat-file
+        Returns the percentage of offline values of the connectivity
+        and the name resolution binned by hour of day and weekday and
+        by day of month. The measured values are binned in a single
+        pass over the timestamps and the prefix sums.
         """
 
-        regex = r"[0-9]{2}\.[0-9]{2}\.[0-9]{4} [0-9]{2}:[0-9]{2}"
-        matches = re.findall(regex, line)
-        if len(matches) == 1:
-            return matches[0]
+        (t_from, t_to) = (None, None)
+        if window is not None:
+            (t_from, t_to) = parse_window(window, self.t_end)
+        if t_from is None:
+            (i, j) = (0, self.n)
         else:
-            raise ValueError("No timestamp found in line")
+            i = bisect.bisect_left(self.t, t_from)
+            j = bisect.bisect_left(self.t, t_to)
+
+        # Number of measured values and offline values for each bin of
+        # weekday x hour followed by the bins of the days of month
+        n_bins = 7 * 24 + 31
+        n = [0] * n_bins
+        n_off_conn = [0] * n_bins
+        n_off_dn_res = [0] * n_bins
+
+        day = None
+        for (t, c_0, c_1, d_0, d_1) in zip(
+            self.t[i:j],
+            self.cum_off_conn[i:j], self.cum_off_conn[i + 1:j + 1],
+            self.cum_off_dn_res[i:j], self.cum_off_dn_res[i + 1:j + 1]
+        ):
+            # The day of month is only computed on change of the day
+            if t // 1440 != day:
+                day = t // 1440
+                # 01.01.1970 was a thursday
+                weekday = (day + 3) % 7
+                bin_dom = 7 * 24 + datetime.date.fromordinal(
+                    day + EPOCH_ORDINAL
+                ).day - 1
+
+            for b in [24 * weekday + (t // 60) % 24, bin_dom]:
+                n[b] += 1
+                n_off_conn[b] += c_1 - c_0
+                n_off_dn_res[b] += d_1 - d_0
+
+        def perc(n_off, b):
+            return 100 * n_off[b] / n[b] if n[b] > 0 else None
+
+        heatmap = {
+            "name": self.name,
+            "window": window
+        }
+        for (check, n_off) in [
+            (CHECK_CONN, n_off_conn),
+            (CHECK_DN_RES, n_off_dn_res)
+        ]:
+            heatmap[check] = {
+                "hour_weekday": [
+                    [perc(n_off, 24 * w + h) for h in range(24)]
+                    for w in range(7)
+                ],
+                "day_of_month": [
+                    perc(n_off, 7 * 24 + d) for d in range(31)
+                ]
+            }
+
+        return heatmap
+
+    def str_heatmap(self, window=None, output="text"):
+        """
+        Returns the heatmaps as text table or as CSV
+        """
+
+        heatmap = self.get_heatmap(window)
+        if output == "csv":
+            sep = ","
+            label = "{}"
+            cell = "{:.2f}"
+            empty = ""
+        else:
+            sep = " "
+            label = "{:>3}"
+            cell = "{:5.1f}"
+            empty = "    -"
+
+        def row(name, values):
+            return sep.join(
+                [label.format(name)]
+                + [empty if v is None else cell.format(v) for v in values]
+            ) + "\n"
+
+        result = ""
+        for (check, title) in [
+            (CHECK_CONN, "Connection"),
+            (CHECK_DN_RES, "Name resolution")
+        ]:
+            result += "# {} offline [%] by hour and weekday ({}{})\n" \
+                .format(
+                    title,
+                    heatmap["name"],
+                    "" if window is None else ", {}".format(window)
+                )
+            result += sep.join([label.format("")] + [
+                "{:>5}".format(h) if output == "text" else h
+                for h in HOURS
+            ]) + "\n"
+            for (w, values) in enumerate(heatmap[check]["hour_weekday"]):
+                result += row(WEEKDAYS[w], values)
+
+            result += "\n# {} offline [%] by day of month ({}{})\n" \
+                .format(
+                    title,
+                    heatmap["name"],
+                    "" if window is None else ", {}".format(window)
+                )
+            result += sep.join([label.format("")] + [
+                "{:>5}".format(d) if output == "text" else d
+                for d in DAYS
+            ]) + "\n"
+            result += row("", heatmap[check]["day_of_month"]) + "\n"
+
+        return result
+
+    def str_prometheus(self):
+        """
+        Returns the results of the evaluation as metrics in the text
+        format of Prometheus. The outage durations are given in
+        minutes and the timestamp of the last measured value in
+        seconds since the epoch, converted from the local time of the
+        stat-file.
+        The histogram only contains ended outages, so its buckets never
+        decrease. The duration of a current outage is given separately.
+        """
+
+        name = self.name.replace("\\", "\\\\").replace('"', '\\"')
+        result = ""
+
+        def metric(key, help, type, values):
+            nonlocal result
+            result += "# HELP stat_conn_{} {}\n".format(key, help)
+            result += "# TYPE stat_conn_{} {}\n".format(key, type)
+            for (suffix, labels, value) in values:
+                result += "stat_conn_{}{}{{{}}} {}\n".format(
+                    key,
+                    suffix,
+                    ",".join(
+                        ['file="{}"'.format(name)]
+                        + ['{}="{}"'.format(k, v) for (k, v) in labels]
+                    ),
+                    value
+                )
+
+        checks = [
+            (CHECK_CONN, self.n_off_conn, self.is_conn, self.off_conn),
+            (CHECK_DN_RES, self.n_off_dn_res, self.is_dn_res,
+             self.off_dn_res)
+        ]
+
+        metric(
+            "values_total", "Number of measured values", "counter",
+            [("", [], self.n)]
+        )
+        metric(
+            "offline_values_total", "Number of measured values offline",
+            "counter",
+            [("", [("check", c)], n_off) for (c, n_off, _, _) in checks]
+        )
+        metric(
+            "up", "Status of the last measured value", "gauge",
+            [("", [("check", c)], int(up)) for (c, _, up, _) in checks]
+        )
+        metric(
+            "last_value_timestamp_seconds",
+            "Time of the last measured value", "gauge",
+            [("", [], epoch_seconds(self.t_end))]
+        )
+
+        metric(
+            "current_outage_duration_minutes",
+            "Duration of the current outage, 0 if there is none", "gauge",
+            [
+                (
+                    "", [("check", c)],
+                    self.t_end - outages[-1]["t_beg"]
+                    if up is False and len(outages) > 0 else 0
+                )
+                for (c, _, up, outages) in checks
+            ]
+        )
+
+        values = []
+        for (c, _, _, outages) in checks:
+            ended = [e for e in outages if "t_end" in e]
+            stats = self.get_stats(ended, self.t_beg, self.t_end) \
+                if self.n > 0 else {"histogram": [], "total": 0, "count": 0}
+            count = 0
+            for bucket in stats["histogram"]:
+                count += bucket["count"]
+                values.append((
+                    "_bucket",
+                    [
+                        ("check", c),
+                        ("le", "+Inf" if bucket["le"] is None
+                         else bucket["le"])
+                    ],
+                    count
+                ))
+            values.append(("_sum", [("check", c)], stats["total"]))
+            values.append(("_count", [("check", c)], stats["count"]))
+        metric(
+            "outage_duration_minutes", "Durations of outages", "histogram",
+            values
+        )
+
+        return result
+
+    def write_prometheus(self, fn):
+        """
+        Writes the metrics of the evaluation atomically to the file fn
+        """
+
+        path_tmp = "{}.tmp".format(fn)
+        with open(path_tmp, "w") as fd:
+            fd.write(self.str_prometheus())
+        os.replace(path_tmp, fn)
+
+    def str(self, window=None):
+        """
+        Returns the results of the evaluation or of the specified time
+        window as text
+        """
+
+        results = self.get_results(window)
 
-    def str(self):
         result = \
-            "Results for {}\n" \
+            "Results for {}{}\n" \
             "- Start time: {}\n" \
             "- End time: {}\n" \
             "- Measured values: {}\n" \
+            .format(
+                results["name"],
+                "" if window is None else " ({})".format(window),
+                results["t_beg"],
+                results["t_end"],
+                results["n"]
+            )
+
+        if results["n"] == 0:
+            return result + "\n"
+
+        result += \
             "- Connection offline [%]: {:.2f}\n" \
             "- Name resolution offline [%]: {:.2f}\n\n" \
             .format(
-                self.name,
-                self.t_beg,
-                self.t_end,
-                self.n,
-                self.perc_off_conn,
-                self.perc_off_dn_res
+                results["perc_off_conn"],
+                results["perc_off_dn_res"]
             )
 
         result += "Connection offline:\n"
-        for e in self.off_conn:
+        for e in results["off_conn"]:
             result += "{} - {}\n".format(e["t_beg"], e["t_end"])
         result += "\nName resolution offline:\n"
-        for e in self.off_dn_res:
-            result += "{} - {}\n".format(e["t_beg"], e["t_end"])
+        for e in results["off_dn_res"]:
+            result += "{} - {} ({})\n".format(
+                e["t_beg"], e["t_end"], CAUSES[e["cause"]]
+            )
+
+        correlation = results["correlation"]
+        result += \
+            "\nName resolution outages by cause:\n" \
+            "- Caused by connectivity loss: {}\n" \
+            "- Partially overlapping: {}\n" \
+            "- DNS only: {}\n" \
+            "- Overlap with connectivity outages [min]: {}\n" \
+            .format(
+                correlation[CAUSE_CONN],
+                correlation[CAUSE_PARTIAL],
+                correlation[CAUSE_DN_RES],
+                correlation["overlap"]
+            )
+
+        for (check, title) in [
+            (CHECK_CONN, "Connection"),
+            (CHECK_DN_RES, "Name resolution")
+        ]:
+            stats = results["stats"][check]
+            result += \
+                "\n{} outage durations [min]:\n" \
+                "- Outages: {}\n" \
+                "- Total: {}\n" \
+                "- Mean: {:.2f}\n" \
+                "- Median: {:.1f}\n" \
+                "- 95th percentile: {}\n" \
+                "- Maximum: {}\n" \
+                "- MTBF: {}\n" \
+                "- MTTR: {}\n" \
+                "- Histogram:\n" \
+                .format(
+                    title,
+                    stats["count"],
+                    stats["total"],
+                    stats["mean"],
+                    stats["median"],
+                    stats["p95"],
+                    stats["max"],
+                    "-" if stats["mtbf"] is None
+                    else "{:.2f}".format(stats["mtbf"]),
+                    "-" if stats["mttr"] is None
+                    else "{:.2f}".format(stats["mttr"])
+                )
+            for bucket in stats["histogram"]:
+                result += "  {:>8}: {}\n".format(
+                    "<= {}".format(bucket["le"]) if bucket["le"] is not None
+                    else "> {}".format(HISTOGRAM_BUCKETS[-1]),
+                    bucket["count"]
+                )
+
+        if len(results["unmatched"]) > 0:
+            result += "\nUnmatched lines:\n"
+            for e in results["unmatched"]:
+                result += "{} {}\n".format(e["t"], e["check"])
 
         return result
 
 
+class stat_conn_join:
+    """
+    This class is responsible to join the lines for the connectivity
+    and the name resolution of a measured value by their timestamp.
+    Lines are kept until the matching line was read, until they are
+    older than the window or until a later measured value was joined.
+    Joined measured values are kept back until no older line is waiting
+    for its match, so they are released in chronological order. If the
+    clock is set back by more than the window, e.g. at the end of
+    daylight saving time, a new segment is started.
+    """
+
+    def __init__(self, window=JOIN_WINDOW):
+        """
+        The constructor initializes an empty join with the window in
+        minutes
+        """
+
+        self.window = window
+
+        # Status of lines waiting for their match for each check and
+        # timestamp
+        self.pending = {
+            CHECK_CONN: {},
+            CHECK_DN_RES: {}
+        }
+
+        # Heap of joined measured values (t, seq, is_connected,
+        # is_dn_resolved) which are not released yet
+        self.ready = []
+        self.seq = 0
+
+        # Latest timestamp read, latest timestamp joined and timestamp
+        # of the last released value
+        self.t_max = None
+        self.t_joined = None
+        self.t_last = None
+
+        # Unmatched lines as (check, t). Joined values which are older
+        # than the last released value are reported as "late".
+        self.unmatched = []
+
+    def add(self, line):
+        """
+        Adds a line of a stat-file to the join and returns the list of
+        measured values (t, is_connected, is_dn_resolved), which are
+        released. Lines without timestamp, e.g. RRSIG record entries,
+        are skipped.
+        """
+
+        m = REGEX_LINE.match(line)
+        if m is None:
+            return []
+
+        t = parse_timestamp(m[1])
+        if REGEX_LINE_CONN.match(m[2]) is not None:
+            (check, other) = (CHECK_CONN, CHECK_DN_RES)
+            status = stat_conn.is_connected(m[2])
+        else:
+            (check, other) = (CHECK_DN_RES, CHECK_CONN)
+            status = stat_conn.is_dn_resolved(m[2])
+
+        values = []
+        if self.t_max is not None and self.t_max - t > self.window:
+            # The clock was set back, so the values of the new segment
+            # are not dropped as older than the previous ones
+            values = self.release(flush=True)
+            self.t_max = None
+            self.t_joined = None
+            self.t_last = None
+
+        if t in self.pending[other]:
+            status_other = self.pending[other][t].pop(0)
+            if len(self.pending[other][t]) == 0:
+                del self.pending[other][t]
+
+            if check == CHECK_CONN:
+                v = (t, self.seq, status, status_other)
+            else:
+                v = (t, self.seq, status_other, status)
+            heapq.heappush(self.ready, v)
+            self.seq += 1
+            if self.t_joined is None or t > self.t_joined:
+                self.t_joined = t
+        else:
+            self.pending[check].setdefault(t, []).append(status)
+
+        if self.t_max is None or t > self.t_max:
+            self.t_max = t
+
+        return values + self.release()
+
+    def release(self, flush=False):
+        """
+        Reports the lines outside of the window and the lines older
+        than the latest joined measured value as unmatched, so a single
+        line does not keep back later values, and returns the list of
+        measured values, which can be released. If flush is set, all
+        lines are reported and all values are released.
+        """
+
+        # Nothing is kept back
+        if len(self.ready) == 0 and flush is False:
+            return []
+
+        for (check, pending) in self.pending.items():
+            for t in [
+                t for t in pending
+                if flush is True or self.t_max - t > self.window
+                or t < self.t_joined
+            ]:
+                self.unmatched += [(check, t)] * len(pending.pop(t))
+
+        t_pending = min(
+            list(self.pending[CHECK_CONN]) + list(self.pending[CHECK_DN_RES]),
+            default=None
+        )
+
+        values = []
+        while len(self.ready) > 0 \
+                and (t_pending is None or self.ready[0][0] <= t_pending):
+            (t, seq, is_connected, is_dn_resolved) = \
+                heapq.heappop(self.ready)
+            if self.t_last is not None and t < self.t_last:
+                self.unmatched.append(("late", t))
+                continue
+
+            self.t_last = t
+            values.append((t, is_connected, is_dn_resolved))
+
+        return values
+
+    def get_state(self):
+        """
+        Returns the state of the join to be stored in a state file
+        """
+
+        return {
+            "pending": [
+                [check, t, status]
+                for (check, pending) in self.pending.items()
+                for (t, statuses) in pending.items()
+                for status in statuses
+            ],
+            "ready": self.ready,
+            "seq": self.seq,
+            "t_max": self.t_max,
+            "t_joined": self.t_joined,
+            "t_last": self.t_last,
+            "unmatched": self.unmatched
+        }
+
+    def set_state(self, state):
+        """
+        Restores the state of the join from a state file
+        """
+
+        for (check, t, status) in state["pending"]:
+            self.pending[check].setdefault(t, []).append(status)
+        self.ready = [tuple(v) for v in state["ready"]]
+        heapq.heapify(self.ready)
+        self.seq = state["seq"]
+        self.t_max = state["t_max"]
+        self.t_joined = state["t_joined"]
+        self.t_last = state["t_last"]
+        self.unmatched = [tuple(v) for v in state["unmatched"]]
+
+
+class stat_conn_merge:
+    """
+    This class is responsible to merge the stat-files of several hosts
+    into a common timeline
+    """
+
+    def __init__(self, fns, join_window=JOIN_WINDOW):
+        """
+        The constructor reads the stat-files of the hosts in parallel.
+        The measured values are merged by timestamp using a heap, so
+        the stat-files are read only once. The evaluations of the hosts
+        and the evaluations of the time periods where all or some hosts
+        were offline are created at once, each keeping its measured
+        values like a single evaluation. Unmatched lines are reported
+        in the evaluation of their host.
+        """
+
+        try:
+            self.hosts = [
+                stat_conn(fn, values=[], join_window=join_window)
+                for fn in fns
+            ]
+            self.all = stat_conn(
+                "all hosts: {}".format(" ".join(fns)), values=[]
+            )
+            self.some = stat_conn(
+                "some hosts: {}".format(" ".join(fns)), values=[]
+            )
+
+            # Status (is_connected, is_dn_resolved) of each host
+            status = [None] * len(fns)
+
+            values = heapq.merge(
+                *[
+                    self.iter_host(i, fn)
+                    for (i, fn) in enumerate(fns)
+                ]
+            )
+            for (t, group) in itertools.groupby(values, lambda v: v[0]):
+                for (t, i, is_connected, is_dn_resolved) in group:
+                    self.hosts[i].add(t, is_connected, is_dn_resolved)
+                    status[i] = (is_connected, is_dn_resolved)
+
+                reported = [v for v in status if v is not None]
+                self.all.add(
+                    t,
+                    any([v[0] for v in reported]),
+                    any([v[1] for v in reported])
+                )
+                self.some.add(
+                    t,
+                    all([v[0] for v in reported]),
+                    all([v[1] for v in reported])
+                )
+
+        except Exception as err:
+            error(err)
+
+    def iter_host(self, i, fn):
+        """
+        Yields the measured values of the stat-file fn of the i-th host
+        as (t, i, is_connected, is_dn_resolved). The lines are joined by
+        the join of the evaluation of the host.
+        """
+
+        for (t, is_connected, is_dn_resolved) in iter_values(
+            fn, join=self.hosts[i].join
+        ):
+            yield (t, i, is_connected, is_dn_resolved)
+
+    def get_evaluations(self):
+        """
+        Returns the evaluations of the hosts followed by the evaluations
+        of the time periods, where all or some hosts were offline
+        """
+
+        return self.hosts + [self.all, self.some]
+
+
+class stat_conn_db(stat_conn):
+    """
+    This class is responsible to query the results of a stat-file from
+    a SQLite database, where the measured values were ingested
+    """
+
+    def __init__(self, path_db, host):
+        """
+        The constructor opens the database and determines the time
+        range of the measured values of the host
+        """
+
+        try:
+            self.name = host
+            self.db = open_db(path_db)
+            (self.t_beg, self.t_end) = \
+                self.db.execute(SQL_RANGE, (host,)).fetchone()
+            if self.t_beg is None:
+                raise ValueError(
+                    "No measured values of {} in {}".format(host, path_db)
+                )
+
+        except Exception as err:
+            error(err)
+
+    def get_outages(self, column, t_from, t_to):
+        """
+        Returns the outages of the column is_connected or is_dn_resolved
+        in the time window [t_from, t_to). Only the changes of the
+        status are returned by the database.
+        """
+
+        # An outage may already have started before the time window
+        status = self.db.execute(
+            SQL_STATUS_BEFORE.format(column), (self.name, t_from)
+        ).fetchone()
+        status = 1 if status is None else status[0]
+
+        outages = []
+        if status == 0:
+            outages.append({
+                "t_beg": self.db.execute(
+                    SQL_OUTAGE_BEG.format(column),
+                    (self.name, t_from, self.name, t_from)
+                ).fetchone()[0]
+            })
+
+        for (t, status) in self.db.execute(
+            SQL_CHANGES.format(column), (status, self.name, t_from, t_to)
+        ):
+            if status == 0:
+                outages.append({
+                    "t_beg": t
+                })
+            else:
+                outages[-1]["t_end"] = t
+
+        # An outage may last beyond the time window
+        if len(outages) > 0 and "t_end" not in outages[-1]:
+            t_end = self.db.execute(
+                SQL_OUTAGE_END.format(column), (self.name, t_to)
+            ).fetchone()[0]
+            if t_end is not None:
+                outages[-1]["t_end"] = t_end
+
+        return outages
+
+    def get_results(self, window=None):
+        """
+        Returns the results like stat_conn.get_results(), which are
+        queried from the database using the index on the timestamps
+        """
+
+        if window is None:
+            (t_from, t_to) = (self.t_beg, self.t_end)
+        else:
+            (t_from, t_to) = parse_window(window, self.t_end)
+            if t_from is None:
+                return self.make_results(
+                    window, None, None, 0, 0, 0, [], [], []
+                )
+
+        # The end of the whole evaluation is the last measured value
+        t_query = t_to + 1 if window is None else t_to
+        (n, n_off_conn, n_off_dn_res) = self.db.execute(
+            SQL_COUNT, (self.name, t_from, t_query)
+        ).fetchone()
+        off_conn = self.get_outages("is_connected", t_from, t_query)
+        off_dn_res = self.get_outages("is_dn_resolved", t_from, t_query)
+
+        return self.make_results(
+            window, t_from, t_to, n, n_off_conn, n_off_dn_res,
+            off_conn, off_dn_res, []
+        )
+
+
+def open_db(path_db):
+    """
+    This function opens the SQLite database of measured values in WAL
+    mode and creates the schema, if necessary
+    """
+
+    db = sqlite3.connect(path_db)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(SQL_SCHEMA)
+    return db
+
+
+def ingest(path_db, host, values):
+    """
+    This function inserts the measured values of the host into the
+    database, which are newer than the last ingested measured value.
+    The values are inserted in batches of INGEST_BATCH values per
+    transaction. Returns the number of inserted values.
+    """
+
+    db = open_db(path_db)
+    try:
+        t_last = db.execute(SQL_RANGE, (host,)).fetchone()[1]
+        values = (
+            (host, t, int(is_connected), int(is_dn_resolved))
+            for (t, is_connected, is_dn_resolved) in values
+            if t_last is None or t > t_last
+        )
+
+        n = 0
+        while True:
+            batch = list(itertools.islice(values, INGEST_BATCH))
+            if len(batch) == 0:
+                break
+
+            with db:
+                db.executemany(SQL_INSERT, batch)
+            n += len(batch)
+
+        return n
+    finally:
+        db.close()
+
+
+def iter_values(fn, join_window=JOIN_WINDOW, join=None):
+    """
+    This function yields the measured values of a stat-file as
+    (t, is_connected, is_dn_resolved) while reading the stat-file. If
+    a join is given, the lines are joined by it, so its unmatched lines
+    are available afterwards.
+    """
+
+    with open(fn, "rb") as raw:
+        fd = open_log(raw)
+        if read_binary_header(fd) is True:
+            while True:
+                buf = fd.read(BINARY_CHUNK * BINARY_RECORD_SIZE)
+                buf = buf[:len(buf) - len(buf) % BINARY_RECORD_SIZE]
+                if len(buf) == 0:
+                    break
+
+                for (t, bits, latency) in struct.iter_unpack(
+                    BINARY_RECORD, buf
+                ):
+                    yield (
+                        t,
+                        bits & BINARY_OFF_CONN == 0,
+                        bits & BINARY_OFF_DN_RES == 0
+                    )
+            return
+
+        fd.seek(0)
+        if join is None:
+            join = stat_conn_join(join_window)
+        for line in fd:
+            yield from join.add(line.decode(errors="replace"))
+        yield from join.release(flush=True)
+
+
+def parse_timestamp(s):
+    """
+    This function converts a timestamp "dd.mm.yyyy HH:MM" to minutes
+    since the epoch
+    """
+
+    days = datetime.date(
+        int(s[6:10]), int(s[3:5]), int(s[0:2])
+    ).toordinal() - EPOCH_ORDINAL
+    return 1440 * days + 60 * int(s[11:13]) + int(s[14:16])
+
+
+def read_binary_header(fd):
+    """
+    This function reads the header of the opened stat-file fd and
+    returns whether it is a binary stat-file. Raises ValueError, if the
+    version of a binary stat-file is not supported.
+    """
+
+    header = fd.read(len(BINARY_HEADER))
+    if not header.startswith(BINARY_MAGIC):
+        return False
+
+    if len(header) < len(BINARY_HEADER):
+        raise ValueError("Binary stat-file with truncated header")
+    (version, _) = struct.unpack("<HH", header[len(BINARY_MAGIC):])
+    if version != BINARY_VERSION:
+        raise ValueError(
+            "Unsupported version {} of binary stat-file".format(version)
+        )
+    return True
+
+
+def open_log(raw):
+    """
+    This function returns a file object reading the decompressed
+    content of the stat-file opened in binary mode as raw. If the
+    stat-file is not compressed, raw is returned.
+    """
+
+    magic = raw.read(6)
+    raw.seek(0)
+    for (prefix, decompressor) in COMPRESSORS:
+        if magic.startswith(prefix):
+            return decompressor(fileobj=raw) \
+                if decompressor is gzip.GzipFile else decompressor(raw)
+
+    return raw
+
+
+def decompress(fn):
+    """
+    This function opens a part of a rotated stat-file. Compressed parts
+    are decompressed to a temporary file, so multiple parts can be
+    decompressed in parallel.
+    """
+
+    raw = open(fn, "rb")
+    fd = open_log(raw)
+    if fd is raw:
+        return raw
+
+    tmp = tempfile.TemporaryFile()
+    with raw, fd:
+        shutil.copyfileobj(fd, tmp)
+    tmp.seek(0)
+    return tmp
+
+
+def sort_parts(parts):
+    """
+    This function sorts the rotated parts of a stat-file by their first
+    timestamp. Parts without timestamp are sorted to the end.
+    """
+
+    parts = sorted(
+        [(get_first_timestamp(fn), fn) for fn in parts],
+        key=lambda e: (e[0] is None, e[0] or 0)
+    )
+    return [fn for (t, fn) in parts]
+
+
+def get_first_timestamp(fn):
+    """
+    This function returns the first timestamp of a stat-file or None,
+    if the stat-file does not contain any timestamp
+    """
+
+    regex = r"[0-9]{2}\.[0-9]{2}\.[0-9]{4} [0-9]{2}:[0-9]{2}"
+    with open(fn, "rb") as raw:
+        for line in open_log(raw):
+            m = re.search(regex, line.decode(errors="replace"))
+            if m is not None:
+                return parse_timestamp(m[0])
+
+    return None
+
+
+def format_timestamp(t):
+    """
+    This function converts minutes since the epoch to a timestamp
+    "dd.mm.yyyy HH:MM"
+    """
+
+    if t is None:
+        return ""
+
+    return (
+        datetime.datetime(1970, 1, 1) + datetime.timedelta(minutes=t)
+    ).strftime(TIMESTAMP_FORMAT)
+
+
+def epoch_seconds(t):
+    """
+    This function converts minutes since the epoch of the local time to
+    seconds since the epoch
+    """
+
+    if t is None:
+        return 0
+
+    return int(time.mktime((
+        datetime.datetime(1970, 1, 1) + datetime.timedelta(minutes=t)
+    ).timetuple()))
+
+
+def parse_period(s):
+    """
+    This function converts a period "yyyy", "yyyy-mm" or "yyyy-mm-dd"
+    to the time window [t_from, t_to) in minutes since the epoch
+    """
+
+    values = [int(v) for v in s.split("-")]
+    if len(values) == 1:
+        d_from = datetime.date(values[0], 1, 1)
+        d_to = datetime.date(values[0] + 1, 1, 1)
+    elif len(values) == 2:
+        d_from = datetime.date(values[0], values[1], 1)
+        d_to = datetime.date(
+            values[0] + values[1] // 12, values[1] % 12 + 1, 1
+        )
+    elif len(values) == 3:
+        d_from = datetime.date(*values)
+        d_to = d_from + datetime.timedelta(days=1)
+    else:
+        raise ValueError("Invalid period: {}".format(s))
+
+    return (
+        1440 * (d_from.toordinal() - EPOCH_ORDINAL),
+        1440 * (d_to.toordinal() - EPOCH_ORDINAL)
+    )
+
+
+def parse_window(s, t_end):
+    """
+    This function converts the window specified by the string s to the
+    time window [t_from, t_to) in minutes since the epoch. Relative
+    windows end with the measured value at t_end. If there is no
+    measured value, a relative window is empty and (None, None) is
+    returned.
+    """
+
+    m = re.fullmatch(r"([0-9]+)([dhm])", s)
+    if m is not None:
+        if t_end is None:
+            return (None, None)
+        t_to = t_end + 1
+        return (t_to - int(m[1]) * WINDOW_UNITS[m[2]], t_to)
+
+    if ".." in s:
+        (s_from, s_to) = s.split("..", 1)
+        return (parse_period(s_from)[0], parse_period(s_to)[1])
+
+    return parse_period(s)
+
+
 def error(err):
     """
     This function raises an error after catching an exception.
@@ -188,12 +1930,41 @@ def error(err):
         err.message if hasattr(err, "message") else err
     )
     print(msg, file=sys.stderr)
-    if hasattr(err, "errno"):
+    if hasattr(err, "errno") and err.errno is not None:
         sys.exit(err.errno)
     else:
         sys.exit(EXIT_FAILURE)
 
 
+def print_event(event, check, t):
+    """
+    This function prints an outage event to STDOUT
+    """
+
+    print("[{}] {} {}".format(t, event, check), flush=True)
+
+
+def make_hook(cmd):
+    """
+    This function returns an event handler, which executes the
+    specified command for each outage event. Failures of the command
+    are reported without stopping to follow the stat-file.
+    """
+
+    def hook(event, check, t):
+        try:
+            proc = subprocess.run([cmd, event, check, t])
+        except OSError as err:
+            print("{}: {}".format(cmd, err), file=sys.stderr, flush=True)
+            return
+        if proc.returncode != 0:
+            print("{}: Exit status {} for {} {} {}".format(
+                cmd, proc.returncode, event, check, t
+            ), file=sys.stderr, flush=True)
+
+    return hook
+
+
 def usage(fail=True):
     """
     This function terminates the program printing usage information.
@@ -208,9 +1979,188 @@ def usage(fail=True):
 
 
 if __name__ == "__main__":
-    if len(sys.argv) <= 1:
+    # Reading commandline arguments
+    follow = False
+    heatmap = False
+    hook = None
+    jobs = 1
+    join_window = JOIN_WINDOW
+    merge = False
+    output = "text"
+    path_binary = None
+    path_db = None
+    path_prometheus = None
+    path_state = None
+    query = False
+    rotated = False
+    windows = []
+    try:
+        (opts, args) = getopt.getopt(
+            sys.argv[1:], "c:d:fhHj:J:mo:p:qrs:w:x:", ["follow"]
+        )
+        for opt in opts:
+            if opt[0] == "-c":
+                path_binary = opt[1]
+            elif opt[0] == "-d":
+                path_db = opt[1]
+            elif opt[0] in ["-f", "--follow"]:
+                follow = True
+            elif opt[0] == "-h":
+                usage(fail=False)
+            elif opt[0] == "-H":
+                heatmap = True
+            elif opt[0] == "-j":
+                jobs = int(opt[1])
+            elif opt[0] == "-J":
+                join_window = int(opt[1])
+            elif opt[0] == "-m":
+                merge = True
+            elif opt[0] == "-o":
+                output = opt[1]
+            elif opt[0] == "-p":
+                path_prometheus = opt[1]
+            elif opt[0] == "-q":
+                query = True
+            elif opt[0] == "-r":
+                rotated = True
+            elif opt[0] == "-s":
+                path_state = opt[1]
+            elif opt[0] == "-w":
+                windows.append(opt[1])
+            elif opt[0] == "-x":
+                hook = opt[1]
+            else:
+                raise Exception()
+    except Exception:
+        usage()
+
+    if len(args) == 0 or jobs < 1 or join_window < 0:
+        usage()
+
+    if output not in ["text", "json"] \
+            and (output != "csv" or heatmap is False):
         usage()
 
-    for fn in sys.argv[1:]:
-        sc = stat_conn(fn)
-        print(sc.str(), end="")
+    if query is True:
+        if path_db is None or heatmap is True or follow is True \
+                or path_prometheus is not None or path_binary is not None:
+            usage()
+
+        results = []
+        for host in args:
+            sc = stat_conn_db(path_db, host)
+            try:
+                for window in windows or [None]:
+                    if output == "json":
+                        results.append(sc.get_results(window))
+                    else:
+                        print(sc.str(window), end="", flush=True)
+            except Exception as err:
+                error(err)
+
+        if output == "json":
+            print(json.dumps(results, indent=4), flush=True)
+        sys.exit(EXIT_SUCCESS)
+
+    # Expand patterns of stat-files
+    fns = []
+    for arg in args:
+        fns += sorted(glob.glob(arg)) or [arg]
+
+    if (path_state is not None or follow is True) \
+            and (len(fns) > 1 or rotated is True):
+        usage()
+
+    if (path_binary is not None or path_prometheus is not None) \
+            and len(fns) > 1 and rotated is False:
+        usage()
+
+    if merge is True and (
+        rotated is True or path_binary is not None
+        or path_state is not None or follow is True
+    ):
+        usage()
+
+    if path_db is not None and (
+        merge is True or path_state is not None or follow is True
+    ):
+        usage()
+
+    if hook is not None and shutil.which(hook) is None:
+        print("Command \"{}\" not found or not executable".format(hook),
+              file=sys.stderr)
+        sys.exit(EXIT_FAILURE)
+
+    if rotated is True:
+        evaluations = [(" ".join(args), fns)]
+    else:
+        evaluations = [(fn, None) for fn in fns]
+
+    if path_db is not None:
+        for (fn, parts) in evaluations:
+            try:
+                if parts is None:
+                    values = iter_values(fn, join_window)
+                else:
+                    values = itertools.chain.from_iterable(
+                        iter_values(part, join_window)
+                        for part in sort_parts(parts)
+                    )
+                n = ingest(path_db, fn, values)
+            except Exception as err:
+                error(err)
+            print("{}: {} measured values ingested".format(fn, n))
+        sys.exit(EXIT_SUCCESS)
+
+    if merge is True:
+        scs = stat_conn_merge(fns, join_window).get_evaluations()
+    else:
+        scs = (
+            stat_conn(
+                fn, path_state, parts, jobs, join_window=join_window,
+                follow=follow
+            )
+            for (fn, parts) in evaluations
+        )
+
+    results = []
+    for sc in scs:
+        try:
+            if path_binary is not None:
+                sc.write_binary(path_binary)
+                continue
+
+            if path_prometheus is not None:
+                sc.write_prometheus(path_prometheus)
+                continue
+
+            for window in windows or [None]:
+                if heatmap is True and output == "json":
+                    results.append(sc.get_heatmap(window))
+                elif heatmap is True:
+                    print(sc.str_heatmap(window, output), end="", flush=True)
+                elif output == "json":
+                    results.append(sc.get_results(window))
+                else:
+                    print(sc.str(window), end="", flush=True)
+        except Exception as err:
+            error(err)
+
+    if output == "json":
+        print(json.dumps(results, indent=4), flush=True)
+
+    if follow is True:
+        if hook is not None:
+            sc.on_event = make_hook(hook)
+        elif path_prometheus is None:
+            sc.on_event = print_event
+
+        if path_prometheus is not None:
+            sc.on_update = lambda: sc.write_prometheus(path_prometheus)
+
+        try:
+            sc.follow()
+        except KeyboardInterrupt:
+            pass
+        except Exception as err:
+            error(err)